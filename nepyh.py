@@ -11,27 +11,56 @@ It's mandatory that the YAML file start with a list.
 Mainly though for Network Elements, the render is done by creating a file for each dictionary in the list.
 The filename is the value of the first dictionary found in the list.
 
+Started without arguments the program opens the GUI (see nepyh_gui.py), with arguments it runs
+the same render engine from the command line without loading PyQt6, e.g.:
+    python3 nepyh.py -d samples/sample_db.yml -t samples/sample_tp.j2 -p my_project
+
 # Source code info:
 This code follow PEP 8 style guide and it use 4 spaces for indentation.
 """
 
-from PyQt6 import QtCore, QtWidgets, QtGui  # import PyQt6 for GUI
+# The modules only needed by some stages (YAML, Jinja2, netaddr, archives, render service...) are imported
+# when the stage runs, so the GUI launch and short commands do not pay for them, see _lazy_import()
 from pathlib import Path
-from netaddr import IPNetwork  # used for custom Jinja2 templates
 import os  # import OS module to create directory
-import errno
 import sys
 import time
-import types
 import shutil
-import jinja2
-import yaml
-import io
+import itertools
+import hashlib
+import json
+import functools
+import contextlib
+import heapq
+import collections.abc
+import ipaddress
+import re
+import fnmatch
+import queue
+import threading
 import traceback
+import io
 import logging
-import ctypes.wintypes
-import subprocess
-import platform
+import importlib.util
+
+
+def _lazy_import(name):  # Return the module, it is executed on first attribute access
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+netaddr = _lazy_import('netaddr')  # used for custom Jinja2 templates
+jinja2 = _lazy_import('jinja2')
+yaml = _lazy_import('yaml')
 
 __author__ = 'Emanuele Rossi'
 __credits__ = ['cyb3rw0lf']
@@ -51,484 +80,2064 @@ __YAMLlint__ = 'http://www.yamllint.com/'
 script_path = Path(__file__).resolve().parent
 __icon__ = os.path.join(script_path, 'assets', 'nepyh_icon.png')
 defFolder = time.strftime('%Y%m%d-%H%M%S')
+manifestFile = '.nepyh_manifest.json'  # Kept inside the project folder by the incremental build
 
 
 # Output files are written inside My Documents folder for Windows and inside script folder for Mac OS and Linux
-if platform.system() == 'Darwin':       # macOS
-    myDocuments = script_path
-elif platform.system() == 'Windows':    # Windows
-    # Get My Documents folder path on Windows
-    CSIDL_PERSONAL = 5       # My Documents
-    SHGFP_TYPE_CURRENT = 0   # Get current, not default value
-    myDoc = ctypes.create_unicode_buffer(ctypes.wintypes.MAX_PATH)
-    ctypes.windll.shell32.SHGetFolderPathW(None, CSIDL_PERSONAL, None, SHGFP_TYPE_CURRENT, myDoc)
-    myDocuments = Path(myDoc.value)
-else:                                   # linux variants
-    myDocuments = script_path
+@functools.lru_cache(maxsize=None)
+def documents_folder():  # Looked up on first use, the commands with an explicit output folder never need it
+    if sys.platform == 'win32':         # Windows
+        import ctypes.wintypes
+        # Get My Documents folder path on Windows
+        CSIDL_PERSONAL = 5       # My Documents
+        SHGFP_TYPE_CURRENT = 0   # Get current, not default value
+        myDoc = ctypes.create_unicode_buffer(ctypes.wintypes.MAX_PATH)
+        ctypes.windll.shell32.SHGetFolderPathW(None, CSIDL_PERSONAL, None, SHGFP_TYPE_CURRENT, myDoc)
+        return Path(myDoc.value)
+    return script_path                  # macOS and linux variants
+
+
+def cache_folder():  # Compiled templates shared between runs
+    return os.path.join(documents_folder(), 'NEPyH_Outputs', '.cache')
+
+
+def __getattr__(name):  # Module attributes computed on first access: myDocuments, cacheFolder
+    if name == 'myDocuments':
+        return documents_folder()
+    if name == 'cacheFolder':
+        return cache_folder()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 ###############################
-##     START of GUI code     ##
+##   START of Engine code    ##
 ###############################
 
-# Drag and Drop filename to QLineEdit
-class DragDropQLineEdit(QtWidgets.QLineEdit):
-    def __init__(self, title, parent, fileType):
-        super().__init__(title, parent)
-        self.fileType = fileType
-        self.setAcceptDrops(True)
+class RenderError(Exception):
+    """
+    Error raised by the render engine when the inputs cannot be processed.
+
+    @param errorText short description shown to the user
+    @param errorArgs details of the error (parser messages, traceback...)
+    """
+
+    def __init__(self, errorText, errorArgs=''):
+        super().__init__(errorText, errorArgs)  # Both args are kept so the error can cross process boundaries
+        self.errorText = errorText
+        self.errorArgs = errorArgs
+
+    def __str__(self):
+        return self.errorText + self.errorArgs
+
+
+class RenderCancelled(RenderError):
+    """Raised by config_gen() when the run is cancelled, the previous outputs are left untouched."""
+
+    def __init__(self, errorText='Task cancelled by the user\n', errorArgs=''):
+        super().__init__(errorText, errorArgs)
 
-    def dragEnterEvent(self, event):
-        if event.mimeData().hasUrls():
-            event.accept()
+
+class RenderStats:
+    """
+    Instrumentation of a config_gen() run, exportable as JSON.
+
+    Collects the duration of each stage, the render time of every device (only the slowest are kept,
+    so memory does not grow with the inventory), the IP filters cache hits/misses and, when the
+    Environment is instrumented, the number of calls and the time spent in each custom filter.
+
+    @param slowest number of slowest devices to keep
+    """
+
+    def __init__(self, slowest=10):
+        self.slowest = slowest
+        self.stages = {}
+        self.devices = 0
+        self.renderTime = 0.0
+        self.slowestDevices = []  # Heap of (seconds, filename)
+        self.filters = {}  # {name: [calls, seconds]}
+        self.cache = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):  # Time the block of code as a stage of the run
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add_device(self, out_file_name, seconds):
+        self.devices += 1
+        self.renderTime += seconds
+        if len(self.slowestDevices) < self.slowest:
+            heapq.heappush(self.slowestDevices, (seconds, out_file_name))
+        elif self.slowest:
+            heapq.heappushpop(self.slowestDevices, (seconds, out_file_name))
+
+    def add_filter(self, name, seconds):
+        calls = self.filters.setdefault(name, [0, 0.0])
+        calls[0] += 1
+        calls[1] += seconds
+
+    def to_dict(self):
+        return {
+            'stages': self.stages,
+            'devices': self.devices,
+            'render_seconds': self.renderTime,
+            'render_seconds_avg': self.renderTime / self.devices if self.devices else 0.0,
+            'slowest_devices': [{'file': name, 'seconds': seconds}
+                                for seconds, name in sorted(self.slowestDevices, reverse=True)],
+            'filters': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.filters.items()},
+            'ip_cache': self.cache,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as stats_file:
+            json.dump(self.to_dict(), stats_file, indent=2)
+
+    def summary(self):  # Short text for the log
+        lines = ['Stages: ' + ', '.join(f'{name} {seconds:.3f}s' for name, seconds in self.stages.items())]
+        if self.devices:
+            lines.append(f'{self.devices} devices rendered in {self.renderTime:.3f}s, '
+                         f'{self.renderTime / self.devices * 1000:.2f}ms per device')
+        if self.slowestDevices:
+            lines.append('Slowest devices: ' + ', '.join(
+                f'{name} {seconds * 1000:.1f}ms' for seconds, name in sorted(self.slowestDevices, reverse=True)))
+        for name, (calls, seconds) in sorted(self.filters.items(), key=lambda item: -item[1][1]):
+            lines.append(f'Filter {name}: {calls} calls, {seconds:.3f}s')
+        return '\n'.join(lines)
+
+
+_filterStats = None  # RenderStats of the running config_gen(), used by the instrumented filters
+
+
+def instrument_filter(name, func):  # Wrap a filter to count its calls and time in the running RenderStats
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = _filterStats
+        if stats is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.add_filter(name, time.perf_counter() - start)
+    return wrapper
+
+
+# Jinja2 filters to handle IP Addresses
+# Every distinct value is parsed once and kept in a bounded LRU cache shared by all the filters,
+# plain IPv4 values are parsed with the stdlib ipaddress module, anything else goes through netaddr
+ParsedNetwork = collections.namedtuple(
+    'ParsedNetwork', ['ip', 'value', 'version', 'prefixlen', 'network', 'broadcast', 'netmask', 'hostmask'])
+ipv4Pattern = re.compile(r'\d{1,3}(\.\d{1,3}){3}(/\d{1,2})?')
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_network(text):
+    if isinstance(text, str) and ipv4Pattern.fullmatch(text):
+        try:
+            iface = ipaddress.IPv4Interface(text)
+        except ValueError:
+            pass  # Let netaddr decide (and raise its own error)
         else:
-            event.ignore()
-
-    def dropEvent(self, event):
-        files = []
-        for url in event.mimeData().urls():
-            files.append(url.toLocalFile())
-        setValidFile(self.fileType, files[0], self)
-
-# Main GUI
-
-
-class MainGUI(QtWidgets.QMainWindow):
-
-    def __init__(self):
-        super(MainGUI, self).__init__()
-
-        # Create empty text box
-        # textEdit = QtWidgets.QTextEdit()
-        # self.setCentralWidget(textEdit)
-
-        # Menubar Quit action:
-        quitAction = QtGui.QAction('&Quit', self)
-        quitAction.setShortcut('Ctrl+Q')
-        quitAction.setStatusTip('Exit application')
-        quitAction.triggered.connect(QtWidgets.QApplication.quit)
-
-        # Menubar Documentation action:
-        documentationAction = QtGui.QAction('&Documentation', self)
-        documentationAction.setShortcut('F1')
-        documentationAction.setStatusTip('Help and guidelines on NEPyH')
-        documentationAction.triggered.connect(lambda: QtGui.QDesktopServices.openUrl(QtCore.QUrl(__homepage__)))
-
-        # Menubar YAML lint action:
-        yamllintAction = QtGui.QAction('&YAML lint', self)
-        yamllintAction.setStatusTip('Online YAML validation tool')
-        yamllintAction.triggered.connect(lambda: QtGui.QDesktopServices.openUrl(QtCore.QUrl(__YAMLlint__)))
-
-        # Menubar Issues action:
-        issuesAction = QtGui.QAction('&Issues', self)
-        issuesAction.setStatusTip('Report bugs and issues')
-        issuesAction.triggered.connect(lambda: QtGui.QDesktopServices.openUrl(QtCore.QUrl(__issues__)))
-
-        # Menubar SW Upgrade action:
-        swupgradeAction = QtGui.QAction('&SW Upgrade', self)
-        swupgradeAction.setStatusTip('Check for new software versions')
-
-        # Menubar About action:
-        aboutAction = QtGui.QAction('&About', self)
-        aboutAction.setStatusTip('Information about NEPyH')
-        aboutAction.triggered.connect(lambda: self.about())
-
-        # Create a status bar
-        self.statusBar()
-
-        # Create a menu bar
-        menubar = self.menuBar()
-
-        # Menubar File
-        fileMenu = menubar.addMenu('&File')
-        fileMenu.addAction(quitAction)
-
-        # Menubar Help
-        helpMenu = menubar.addMenu('&Help')
-        helpMenu.addAction(documentationAction)
-        helpMenu.addAction(yamllintAction)
-        helpMenu.addAction(issuesAction)
-        helpMenu.addAction(swupgradeAction)
-        helpMenu.addAction(aboutAction)
-
-        # Create a toolbar
-        # toolbar = self.addToolBar('CFG Gen')
-        # toolbar.addAction(changeLayoutCFG)
-        # toolbar = self.addToolBar('Shut / No Shut')
-
-        # Create a central Widgets
-        centralWidget = QtWidgets.QWidget()
-
-        # Create a Layout for the central Widget
-        centralLayout = QtWidgets.QGridLayout()
-
-        # Config generator Layout elements
-        # Labels
-        self.databaseLb = QtWidgets.QLabel('Database: (YAML)')
-        self.templateLb = QtWidgets.QLabel('Template: (Jinja2)')
-        self.projectLb = QtWidgets.QLabel('Project name:')
-        self.fileExtLb = QtWidgets.QLabel('Output file extension:')
-        # Text lines
-        self.databaseEdit = DragDropQLineEdit('< Drag & Drop a YAML file or Browse >', self, 'YAML')
-        self.databaseEdit.focusInEvent = bind(
-            lambda w, e: QtCore.QTimer.singleShot(0, w.selectAll),
-            self.databaseEdit)  # This is needed to select all text when click on LineEdit
-        self.templateEdit = DragDropQLineEdit('< Drag & Drop a Jinja2 file or Browse >', self, 'JINJA')
-        self.templateEdit.focusInEvent = bind(
-            lambda w, e: QtCore.QTimer.singleShot(0, w.selectAll),
-            self.templateEdit)  # This is needed to select all text when click on LineEdit
-        self.projectEdit = QtWidgets.QLineEdit(defFolder)
-        self.projectEdit.focusInEvent = bind(
-            lambda w, e: QtCore.QTimer.singleShot(0, w.selectAll),
-            self.projectEdit)  # This is needed to select all text when click on LineEdit
-        self.fileExtEdit = QtWidgets.QLineEdit('.txt')
-        self.fileExtEdit.focusInEvent = bind(
-            lambda w, e: QtCore.QTimer.singleShot(0, w.selectAll),
-            self.fileExtEdit)  # This is needed to select all text when click on LineEdit
-        # Buttons
-        self.databaseBtn = QtWidgets.QPushButton('Browse')
-        self.databaseBtn.clicked.connect(lambda: self._getFilePath(self.databaseEdit))
-        self.templateBtn = QtWidgets.QPushButton('Browse')
-        self.templateBtn.clicked.connect(lambda: self._getFilePath(self.templateEdit))
-        self.projectBtn = QtWidgets.QPushButton('Update')
-        self.projectBtn.clicked.connect(self._updateDefFolder)
-        self.cfgenBtn = QtWidgets.QPushButton('Run')
-        self.cfgenBtn.clicked.connect(self.config_gen)
-
-        # Config generator Layout - make a grid and stitch all together
-        cfgenLayout = QtWidgets.QGridLayout()
-        cfgenLayout.setSpacing(10)
-        cfgenLayout.addWidget(self.databaseLb, 1, 0)
-        cfgenLayout.addWidget(self.databaseEdit, 1, 1)
-        cfgenLayout.addWidget(self.databaseBtn, 1, 2)
-
-        cfgenLayout.addWidget(self.templateLb, 2, 0)
-        cfgenLayout.addWidget(self.templateEdit, 2, 1)
-        cfgenLayout.addWidget(self.templateBtn, 2, 2)
-
-        cfgenLayout.addWidget(self.projectLb, 3, 0)
-        cfgenLayout.addWidget(self.projectEdit, 3, 1)
-        cfgenLayout.addWidget(self.projectBtn, 3, 2)
-
-        cfgenLayout.addWidget(self.fileExtLb, 4, 0)
-        cfgenLayout.addWidget(self.fileExtEdit, 4, 1)
-
-        cfgenLayout.addWidget(self.cfgenBtn, 4, 2)
-
-        # Set the default Layout
-        # centralWidget.setLayout(centralLayout)
-        centralWidget.setLayout(cfgenLayout)
-
-        # Set the Widget
-        self.setCentralWidget(centralWidget)
-
-        # Set main windows size, position, title and icons
-        self.resize(600, 10)
-        self.center()
-        self.setWindowTitle(__appName__)
-        self.setWindowIcon(QtGui.QIcon(__icon__))
-        self.show()
-
-        # Override system excepthook to show error within the GUI
-        sys.excepthook = self._excepthook
-
-    def center(self):  # [GUI] Move the main window to the center of the screen
-        qr = self.frameGeometry()
-        cp = QtGui.QGuiApplication.primaryScreen().availableGeometry().center()
-        qr.moveCenter(cp)
-        self.move(qr.topLeft())
-
-    def closeEvent(self, event):  # [GUI] The main window is closed
-        event.accept()
-
-    def about(self):  # [GUI] Ab out window
-        aboutMsg = QtWidgets.QMessageBox()
-        aboutMsg.setContentsMargins(10, 0, 40, 0)
-        aboutMsg.setWindowTitle('About')
-        aboutMsg.setText(f'\n   {__appName__}\n\n'
-                         f'        Author: {__author__}\n'
-                         f'        Version: {__version__}\n'
-                         f'        License:  {__license__}\n\n'
-                         f'        {__homepage__}'
-                         )
-        aboutMsg.setStandardButtons(QtWidgets.QMessageBox.StandardButton.Ok)
-        aboutMsg.exec()
-
-    ###############################
-    ##      END of GUI code      ##
-    ###############################
-
-    def _updateDefFolder(self):
-        defFolder = time.strftime('%Y%m%d-%H%M%S')
-        self.projectEdit.setText(defFolder)
-
-    def _getFilePath(self, textField):
-        fileName = ''
-        if textField.fileType == 'YAML':
-            fileName = QtWidgets.QFileDialog.getOpenFileName(self, 'Select file', '.', '*.yml *.yaml')[0]
-
-        if textField.fileType == 'JINJA':
-            fileName = QtWidgets.QFileDialog.getOpenFileName(self, 'Select file', '.', '*.j2 *.jinja')[0]
-
-        setValidFile(textField.fileType, fileName, textField)
-
-    def _excepthook(self, excType, excValue, tracebackobj):
-        """
-        Global function to catch unhandled exceptions.
+            net = iface.network
+            return ParsedNetwork(str(iface.ip), int(iface.ip), 4, str(net.prefixlen), str(net.network_address),
+                                 # netaddr has no broadcast address for /31 and /32
+                                 str(net.broadcast_address) if net.prefixlen < 31 else str(None),
+                                 str(net.netmask), str(net.hostmask))
+    net = netaddr.IPNetwork(text)
+    return ParsedNetwork(str(net.ip), int(net.ip), net.version, str(net.prefixlen), str(net.network),
+                         str(net.broadcast), str(net.netmask), str(net.hostmask))
 
-        @param excType exception type
-        @param excValue exception value
-        @param tracebackobj traceback object
-        """
-        infoVersion = f'Version: {__version__} \n'
-        separator = '-' * 80
-        notice = ('An unhandled exception occurred.\n'
-                  f'Please report the problem via email to <{__email__}>\n'
-                  f'A log has been written to {__logfile__}\n\n'
-                  'Expand for more details:')
-        timeString = time.strftime("%Y-%m-%d, %H:%M:%S")
-
-        tbinfofile = io.StringIO()
-        traceback.print_tb(tracebackobj, None, tbinfofile)
-        tbinfofile.seek(0)
-        tbinfo = tbinfofile.read()
-        errmsg = f'{str(excType)}: \n{str(excValue)}'
-        sections = [separator, timeString, separator, errmsg, separator, tbinfo]
-        msg = '\n'.join(sections)
-        logging.error(infoVersion + msg)
-        errorbox = QtWidgets.QMessageBox()
-        errorbox.setContentsMargins(10, 0, 40, 0)
-        errorbox.setIcon(QtWidgets.QMessageBox.Icon.Critical)
-        errorbox.setWindowTitle('Unhandled Error')
-        errorbox.setText(notice)
-        errorbox.setDetailedText(str(infoVersion) + str(msg))
-        errorbox.exec()
-
-    def handleErrors(self, errorText, errorArgs):
-        logging.error(errorText + errorArgs)
-        err_msg = QtWidgets.QMessageBox()
-        err_msg.setContentsMargins(10, 0, 40, 0)
-        err_msg.setIcon(QtWidgets.QMessageBox.Icon.Critical)
-        err_msg.setWindowTitle('Error')
-        err_msg.setText(errorText)
-        err_msg.setDetailedText(errorArgs)
-        err_msg.setStandardButtons(QtWidgets.QMessageBox.StandardButton.Ok)
-        err_msg.exec()
-
-    def openFile(self, filepath):
-        if platform.system() == 'Darwin':       # macOS
-            subprocess.call(('open', filepath))
-        elif platform.system() == 'Windows':    # Windows
-            os.startfile(filepath)
-        else:                                   # linux variants
-            subprocess.call(('xdg-open', filepath))
-
-    def checkdir(self, out_path):  # This function will check if the destination folder already exist and create one if not
-        attempts = 0
-        while attempts < 3:  # Try multiple time to fix when file is already opened
-            try:
-                os.makedirs(out_path)
-                return True
-            except OSError as exc:
-                if exc.errno == errno.EEXIST:
-                    reply = QtWidgets.QMessageBox.question(
-                        self, 'Warning', 'Project folder already exists and will be overwritten, continue?', QtWidgets.QMessageBox.StandardButton.Yes
-                        | QtWidgets.QMessageBox.StandardButton.No, QtWidgets.QMessageBox.StandardButton.No)
-                    if reply == QtWidgets.QMessageBox.StandardButton.Yes:
-                        shutil.rmtree(out_path)
-                    else:
-                        return False
-                elif exc.errno == 13:
-                    errorArgs = 'One of the files is already in use, please close the application and try again.\n'
-                    errorArgs = errorArgs + str(exc.args)
-                    logging.debug(errorArgs)
-                    attempts += 1
-                else:
-                    logging.debug(str(exc.args))
-                    attempts += 1
 
-    # Jinja2 filters to handle IP Addresses
-    def j2filter_ip(self, text):
-        return str(IPNetwork(text).ip)
+def parse_network(text):  # Return the ParsedNetwork of an IP Address/Prefix, cached when the value is hashable
+    try:
+        return _parse_network(text)
+    except TypeError:
+        return _parse_network.__wrapped__(text)
 
-    def j2filter_ipadd(self, text, num):
-        return str(IPNetwork(text).ip.__add__(int(num)))
 
-    def j2filter_network(self, text):
-        return str(IPNetwork(text).network)
+def filter_stats():  # Hit/miss counters of the parsed IP Address cache
+    return _parse_network.cache_info()
 
-    def j2filter_broadcast(self, text):
-        return str(IPNetwork(text).broadcast)
 
-    def j2filter_bitmask(self, text):
-        return str(IPNetwork(text).prefixlen)
+def j2filter_ip(text):
+    return parse_network(text).ip
 
-    def j2filter_netmask(self, text):
-        return str(IPNetwork(text).netmask)
 
-    def j2filter_wildmask(self, text):
-        return str(IPNetwork(text).hostmask)
+def j2filter_ipadd(text, num):
+    net = parse_network(text)
+    value = net.value + int(num)
+    if net.version == 4 and 0 <= value <= 0xFFFFFFFF:
+        return str(ipaddress.IPv4Address(value))
+    return str(netaddr.IPNetwork(text).ip.__add__(int(num)))  # IPv6 formatting and out of range errors from netaddr
 
-    def config_gen(self):  # This function cover the config generator
-        out_path = os.path.join(myDocuments, 'NEPyH_Outputs', Path(self.projectEdit.text()))
-        db_path = self.databaseEdit.text()
-        tp_path = Path(self.templateEdit.text()).parent
-        tp_name = Path(self.templateEdit.text()).name
-        fileExt = self.fileExtEdit.text()
 
-        if self.checkdir(out_path) == False:
-            return
+def j2filter_network(text):
+    return parse_network(text).network
 
-        report = ''  # Initialize final report to the user for each config_gen() cycle
 
-        # Load data from YAML into Python dictionary
-        infomsg = 'Load YAML database...'
-        report += f'{infomsg}\n'
-        logging.info(infomsg)
+def j2filter_broadcast(text):
+    return parse_network(text).broadcast
+
+
+def j2filter_bitmask(text):
+    return parse_network(text).prefixlen
+
+
+def j2filter_netmask(text):
+    return parse_network(text).netmask
+
+
+def j2filter_wildmask(text):
+    return parse_network(text).hostmask
+
+
+# Jinja2 filters to build address plans in bulk: the addresses are computed as integers over a range
+# and formatted in one pass, without creating a netaddr object for each address
+def _ip_formatter(version):
+    if version == 4:
+        import socket
+        return lambda value: socket.inet_ntoa(value.to_bytes(4, 'big'))
+    return lambda value: str(netaddr.IPAddress(value, 6))
+
+
+maxAddresses = 65536  # Longest list hosts and subnets build without an explicit count, a /16 of IPv4
+
+
+def _subnet_range(net):  # Return (first, last, width, prefixlen) of the subnet as integers
+    width = 32 if net.version == 4 else 128
+    prefixlen = int(net.prefixlen)
+    hostbits = width - prefixlen
+    first = net.value >> hostbits << hostbits
+    return first, first + (1 << hostbits) - 1, width, prefixlen
+
+
+def j2filter_hosts(text, count=None):
+    first, last, width, prefixlen = _subnet_range(parse_network(text))
+    # Same usable range as netaddr iter_hosts (RFC 3021 for IPv4, RFC 6164 for IPv6)
+    if width == 32 and prefixlen < 31:
+        first, last = first + 1, last - 1
+    elif width == 128 and prefixlen < 127:
+        first += 1
+    if count is not None:
+        last = min(last, first + int(count) - 1)
+    elif last - first + 1 > maxAddresses:
+        raise ValueError(f'{text} has more than {maxAddresses} hosts, give a count!')
+    return list(map(_ip_formatter(parse_network(text).version), range(first, last + 1)))
+
+
+def j2filter_subnets(text, prefixlen, count=None):
+    net = parse_network(text)
+    first, last, width, netprefix = _subnet_range(net)
+    prefixlen = int(prefixlen)
+    if not 0 <= prefixlen <= width:
+        raise ValueError(f'CIDR prefix /{prefixlen} invalid for IPv{net.version}!')
+    if prefixlen < netprefix:
+        return []
+    size = 1 << (width - prefixlen)
+    max_subnets = 1 << (prefixlen - netprefix)
+    if count is None and max_subnets > maxAddresses:
+        raise ValueError(f'{text} has more than {maxAddresses} subnets /{prefixlen}, give a count!')
+    count = max_subnets if count is None else int(count)
+    if not 1 <= count <= max_subnets:
+        raise ValueError('count outside of current IP subnet boundary!')
+    fmt = _ip_formatter(net.version)
+    return [f'{fmt(value)}/{prefixlen}' for value in range(first, first + size * count, size)]
+
+
+def j2filter_ipaddlist(texts, num):
+    num = int(num)
+    fmt = _ip_formatter(4)
+    result = []
+    for text in texts:
+        net = parse_network(text)
+        value = net.value + num
+        if net.version == 4 and 0 <= value <= 0xFFFFFFFF:
+            result.append(fmt(value))
+        else:
+            result.append(j2filter_ipadd(text, num))
+    return result
+
+
+j2filters = {
+    'ip': j2filter_ip,
+    'ipadd': j2filter_ipadd,
+    'network': j2filter_network,
+    'broadcast': j2filter_broadcast,
+    'bitmask': j2filter_bitmask,
+    'netmask': j2filter_netmask,
+    'wildmask': j2filter_wildmask,
+    'hosts': j2filter_hosts,
+    'subnets': j2filter_subnets,
+    'ipaddlist': j2filter_ipaddlist,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def yaml_loaders():  # Return (SafeLoader, StreamLoader), the libyaml C implementation when PyYAML has been built with it
+    if not yaml.__with_libyaml__:
+        return yaml.SafeLoader, yaml.SafeLoader
+
+    class StreamLoader(yaml.cyaml.CParser, yaml.composer.Composer, yaml.constructor.SafeConstructor,
+                       yaml.resolver.Resolver):
+        # Same as CSafeLoader plus the Composer methods needed to build one node of the list at a time
+        def __init__(self, stream):
+            yaml.cyaml.CParser.__init__(self, stream)
+            yaml.composer.Composer.__init__(self)
+            yaml.constructor.SafeConstructor.__init__(self)
+            yaml.resolver.Resolver.__init__(self)
+
+    return yaml.CSafeLoader, StreamLoader
+
+
+def yaml_error(exc):  # Convert a YAML parser exception into a RenderError for the user
+    errorText = ('An error occurred while parsing YAML file\n\n'
+                 'Please correct data and retry.\n')
+    if hasattr(exc, 'problem_mark'):
+        if exc.context != None:
+            errorArgs = ('Parser says:\n'
+                         f'{str(exc.problem_mark)}\n'
+                         f'{str(exc.problem)} {str(exc.context)}\n\n'
+                         f'Use lint to validate your code: {__YAMLlint__}')
+        else:
+            errorArgs = ('Parser says:\n'
+                         f'{str(exc.problem_mark)}\n'
+                         f'{str(exc.problem)}\n\n'
+                         f'Use lint to validate your code: {__YAMLlint__}')
+    else:
+        errorArgs = (f'Parser says:\n{str(exc)}\n\n'
+                     f'Use lint to validate your code: {__YAMLlint__}')
+    return RenderError(errorText, errorArgs)
+
+
+databaseFormats = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}  # Any other file is YAML
+databaseExtensions = ['.yaml', '.yml', *databaseFormats]
+dbCacheVersion = 1
+
+
+def database_format(db_path):  # 'yaml', 'csv', 'json' or 'jsonl' from the file extension
+    return databaseFormats.get(os.path.splitext(str(db_path))[1].lower(), 'yaml')
+
+
+def load_database(db_path, select=None, cache=True):  # Load data from YAML, CSV or JSON into Python list of dictionaries
+    if os.path.isdir(db_path):
+        return list(ShardedDatabase(db_path, cache).load(select))
+    input_db = read_database_file(db_path, cache)
+    if select and isinstance(input_db, list):
+        input_db = list(select_entries(input_db, select))
+    return input_db
+
+
+def iter_database(db_path, select=None, cache=True):  # Stream the list one dictionary at a time, memory is bounded by the largest entry
+    if os.path.isdir(db_path):
+        entries = ShardedDatabase(db_path, cache).load(select)  # One shard at a time
+    else:
+        dbFormat = database_format(db_path)
+        if dbFormat == 'csv':
+            entries = _iter_csv(db_path)
+        elif dbFormat == 'jsonl':
+            entries = _iter_jsonl(db_path)
+        elif dbFormat == 'json':  # A JSON document is parsed at once
+            entries = _load_json(db_path) or []
+        else:
+            entries = _iter_yaml(db_path)
+    if select and not os.path.isdir(db_path):
+        entries = select_entries(entries, select)
+    yield from entries
+
+
+def read_database_file(db_path, cache=True):  # Parse one database file, the format is given by the extension
+    dbFormat = database_format(db_path)
+    if dbFormat == 'csv':
+        return list(_iter_csv(db_path))
+    if dbFormat == 'jsonl':
+        return list(_iter_jsonl(db_path))
+    if dbFormat == 'json':
+        return _load_json(db_path)
+    return _load_yaml(db_path, cache)
+
+
+def _load_yaml(db_path, cache=True):
+    # The parsed YAML is kept in a pickle of the cache folder, one per database path: it is used when the file
+    # has the same mtime and size, or the same content if only the mtime changed. Loading it is many times
+    # faster than building the objects again with the YAML parser
+    if not cache:
         try:
-            input_db = yaml.load(open(db_path), Loader=yaml.SafeLoader)
+            with open(db_path, 'rb') as db_file:
+                return yaml.load(db_file, Loader=yaml_loaders()[0])
         except yaml.YAMLError as exc:
-            errorText = ('An error occurred while parsing YAML file\n\n'
-                         'Please correct data and retry.\n')
-            if hasattr(exc, 'problem_mark'):
-                if exc.context != None:
-                    errorArgs = ('Parser says:\n'
-                                 f'{str(exc.problem_mark)}\n'
-                                 f'{str(exc.problem)} {str(exc.context)}\n\n'
-                                 f'Use lint to validate your code: {__YAMLlint__}')
-                    self.handleErrors(errorText, errorArgs)
+            raise yaml_error(exc) from exc
+
+    import pickle
+    cache_path = os.path.join(cache_folder(), 'database',
+                              hashlib.sha256(os.path.abspath(db_path).encode()).hexdigest() + '.pickle')
+    stat = os.stat(db_path)
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cached = pickle.load(cache_file)
+        if cached['version'] != dbCacheVersion:
+            cached = None
+        elif (cached['mtime'], cached['size']) == (stat.st_mtime_ns, stat.st_size):
+            return cached['data']
+    except Exception:  # Missing, truncated or written by another version
+        cached = None
+
+    with open(db_path, 'rb') as db_file:
+        digest = hashlib.sha256(db_file.read()).hexdigest()
+        if cached is not None and cached['sha256'] == digest:
+            data = cached['data']
+        else:
+            db_file.seek(0)  # Parsed from the file, so the errors report its name
+            try:
+                data = yaml.load(db_file, Loader=yaml_loaders()[0])
+            except yaml.YAMLError as exc:
+                raise yaml_error(exc) from exc
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path + '.tmp', 'wb') as cache_file:
+            pickle.dump({'version': dbCacheVersion, 'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+                         'sha256': digest, 'data': data}, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_path + '.tmp', cache_path)
+    except (OSError, pickle.PicklingError) as exc:
+        logging.debug(f'Database cache not saved: {exc}')
+    return data
+
+
+def _load_json(db_path):
+    try:
+        with open(db_path, 'rb') as db_file:
+            return json.load(db_file)
+    except ValueError as exc:
+        raise RenderError('An error occurred while parsing JSON file\n\n'
+                          'Please correct data and retry.\n', f'Parser says:\n{exc}') from exc
+
+
+def _iter_jsonl(db_path):  # JSON Lines: one device dictionary per line, empty lines are skipped
+    with open(db_path, 'rb') as db_file:
+        for number, line in enumerate(db_file, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as exc:
+                    raise RenderError('An error occurred while parsing JSON Lines file\n\n'
+                                      'Please correct data and retry.\n',
+                                      f'Parser says:\nline {number}: {exc}') from exc
+
+
+def _iter_csv(db_path):
+    # One device per row, the first column is the name. Empty cells are left out (as a missing YAML key)
+    # and the dots of the headers build nested dictionaries: 'mgt.ip' is {'mgt': {'ip': ...}}. Values are strings
+    import csv
+    with open(db_path, newline='', encoding='utf-8-sig') as db_file:
+        reader = csv.DictReader(db_file)
+        try:
+            for row in reader:
+                entry = {}
+                for key, value in row.items():
+                    if key is None or value in ('', None):  # Cells without header, or missing at the end of the row
+                        continue
+                    *parents, leaf = key.split('.')
+                    target = entry
+                    for level, parent in enumerate(parents, 1):
+                        target = target.setdefault(parent, {})
+                        if not isinstance(target, dict):
+                            raise csv.Error(f"column '{key}' conflicts with column '{'.'.join(parents[:level])}'")
+                    if isinstance(target.get(leaf), dict):
+                        raise csv.Error(f"column '{key}' conflicts with the columns '{key}.*'")
+                    target[leaf] = value
+                yield entry
+        except csv.Error as exc:
+            raise RenderError('An error occurred while parsing CSV file\n\n'
+                              'Please correct data and retry.\n',
+                              f'Parser says:\nline {reader.line_num}: {exc}') from exc
+
+
+def _iter_yaml(db_path):
+    try:
+        with open(db_path) as db_file:
+            loader = yaml_loaders()[1](db_file)
+            try:
+                loader.get_event()  # StreamStartEvent
+                if loader.check_event(yaml.StreamEndEvent):  # Empty file
                     return
-                else:
-                    errorArgs = ('Parser says:\n'
-                                 f'{str(exc.problem_mark)}\n'
-                                 f'{str(exc.problem)}\n\n'
-                                 f'Use lint to validate your code: {__YAMLlint__}')
-                    self.handleErrors(errorText, errorArgs)
+                loader.get_event()  # DocumentStartEvent
+                if not loader.check_event(yaml.SequenceStartEvent):
+                    # Not a list: yield what a full load would iterate, the render step reports the error
+                    yield from loader.construct_document(loader.compose_node(None, None))
                     return
+                loader.get_event()  # SequenceStartEvent
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    node = loader.compose_node(None, None)
+                    loader.peek_event()  # Look ahead so a syntax error right after the entry is raised before rendering it
+                    yield loader.construct_document(node)
+            finally:
+                loader.dispose()
+    except yaml.YAMLError as exc:
+        raise yaml_error(exc) from exc
 
-        # Load Jinja2 template
-        infomsg = 'Create Jinja2 Environment...'
-        report += f'{infomsg}\n'
-        logging.info(infomsg)
-        env = jinja2.Environment(loader=jinja2.FileSystemLoader(str(tp_path)), trim_blocks=True, lstrip_blocks=True)
-        env.filters['ip'] = self.j2filter_ip
-        env.filters['ipadd'] = self.j2filter_ipadd
-        env.filters['network'] = self.j2filter_network
-        env.filters['broadcast'] = self.j2filter_broadcast
-        env.filters['bitmask'] = self.j2filter_bitmask
-        env.filters['netmask'] = self.j2filter_netmask
-        env.filters['wildmask'] = self.j2filter_wildmask
-
-        infomsg = 'Load Jinja2 Template...'
-        report += f'{infomsg}\n'
-        logging.info(infomsg)
-        try:
-            input_tp = env.get_template(tp_name)
-        except jinja2.TemplateNotFound:
-            errorText = f'{tp_name}: File not found\n'
-            errorArgs = f"File '{tp_name}' not found in {str(tp_path)}\n"
-            self.handleErrors(errorText, errorArgs)
-            return
-        except jinja2.TemplateSyntaxError as exc:
-            errorText = ('An error occurred while reading Jinja2 template\n\n'
-                         'Please correct data and retry.\n')
-            errorArgs = ('Syntax check failed:\n'
-                         f' {exc.message} '
-                         f'in {exc.filename} at line {exc.lineno}')
-            self.handleErrors(errorText, errorArgs)
-            return
 
-        # Render the template with data and print the output
-        infomsg = 'Rendering templates...'
-        report += f'{infomsg}\n'
-        logging.info(infomsg)
+def device_selected(name, select):  # True if the device name matches one of the glob patterns
+    return any(fnmatch.fnmatchcase(str(name), pattern) for pattern in select)
+
+
+def select_entries(entries, select):  # Keep only the entries whose name (first value) matches the selection
+    for entry in entries:
         try:
-            for entry in input_db:
-                result = input_tp.render(entry)
-                out_file_name = next(iter(entry.values())) + fileExt
-                out_file = open(os.path.join(out_path, out_file_name), 'w')
-                out_file.write(result)
-                out_file.close()
-                infomsg = f"Configuration '{out_file_name}' created..."
-                report += f'{infomsg}\n'
-                logging.info(infomsg)
-        except ValueError as exc:
-            errorText = ('An error occurred while rendering the templates\n'
-                         'The YAML file must start with a list of dictionary\n\n'
-                         'Please correct data and retry.\n')
-            errorArgs = (str(traceback.format_exc()))
-            self.handleErrors(errorText, errorArgs)
-            return
-        except jinja2.UndefinedError as exc:
-            errorText = ('An error occurred while parsing Jinja2 template\n\n'
-                         'Please correct data and retry.\n')
-            errorArgs = exc.message
-            self.handleErrors(errorText, errorArgs)
-            return
+            name = next(iter(entry.values()))
+        except Exception:
+            yield entry  # Not a valid entry, the render step reports the error
+            continue
+        if device_selected(name, select):
+            yield entry
+
+
+def database_files(db_path):  # Files holding the database: the YAML file itself or the shards of a folder
+    if os.path.isdir(db_path):
+        return [os.path.join(db_path, relpath) for relpath in ShardedDatabase.shards(db_path)]
+    return [db_path]
+
+
+class ShardedDatabase:
+    """
+    Database split in many files inside a folder, e.g. one file per device or per site (sub-folders allowed).
+
+    Each file holds a list of dictionaries or a single dictionary, files are read in alphabetical order.
+    An index of device name -> (file, offsets) is kept in the folder and refreshed only for the files
+    that changed, so rendering a selection of devices reads and parses only the entries needed.
+    """
+
+    indexFile = '.nepyh_index.json'
+    indexVersion = 1
+
+    def __init__(self, db_path, cache=True):
+        self.db_path = str(db_path)
+        self.cache = cache
+        self.index = self._update_index()
+
+    @staticmethod
+    def shards(db_path):  # Relative paths of the database files of the folder, the hidden ones (the index) are skipped
+        shards = []
+        for root, dirs, files in os.walk(db_path):
+            dirs[:] = [folder for folder in dirs if not folder.startswith('.')]
+            for name in files:
+                if not name.startswith('.') and os.path.splitext(name)[1].lower() in databaseExtensions:
+                    shards.append(os.path.relpath(os.path.join(root, name), db_path))
+        return sorted(shards)
+
+    def _scan(self, relpath):  # Return [[name, start, end]] of the entries of a shard, offsets are None if not sliceable
+        devices = []
+        if database_format(relpath) != 'yaml':  # Other formats are not sliced, the whole shard is loaded
+            return [[self._entry_name(entry), None, None] for entry in self._load_shard(relpath)]
+        try:
+            with open(os.path.join(self.db_path, relpath)) as db_file:
+                loader = yaml_loaders()[0](db_file)
+                try:
+                    loader.get_event()  # StreamStartEvent
+                    if loader.check_event(yaml.StreamEndEvent):  # Empty file
+                        return devices
+                    loader.get_event()  # DocumentStartEvent
+                    if loader.check_event(yaml.MappingStartEvent):  # Single device
+                        devices.append([self._scan_entry(loader)[0], None, None])
+                    elif loader.check_event(yaml.SequenceStartEvent):
+                        sliceable = not loader.get_event().flow_style
+                        while not loader.check_event(yaml.SequenceEndEvent):
+                            name, start, end = self._scan_entry(loader)
+                            devices.append([name, start, end] if sliceable else [name, None, None])
+                finally:
+                    loader.dispose()
+        except yaml.YAMLError as exc:
+            raise yaml_error(exc) from exc
+        return devices
+
+    @staticmethod
+    def _scan_entry(loader):  # Skip one entry with the parser events, return (name, start, end)
+        event = loader.get_event()
+        start = event.start_mark.index - event.start_mark.column  # From the beginning of the line, with the '- '
+        name = None
+        if isinstance(event, yaml.MappingStartEvent) and loader.check_event(yaml.ScalarEvent):
+            loader.get_event()  # First key
+            if loader.check_event(yaml.ScalarEvent):
+                name = loader.peek_event().value
+        depth = 0 if isinstance(event, (yaml.ScalarEvent, yaml.AliasEvent)) else 1
+        while depth:
+            event = loader.get_event()
+            if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+                depth += 1
+            elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+                depth -= 1
+        return name, start, event.end_mark.index
+
+    def _update_index(self):
+        index_path = os.path.join(self.db_path, self.indexFile)
+        try:
+            with open(index_path) as index_file:
+                index = json.load(index_file)
+            if index.get('version') != self.indexVersion:
+                index = {}
+        except (OSError, ValueError):
+            index = {}
+        files = index.get('files', {})
+        updated = {}
+        for relpath in self.shards(self.db_path):
+            stat = os.stat(os.path.join(self.db_path, relpath))
+            shard = files.get(relpath)
+            if shard is None or shard['mtime'] != stat.st_mtime_ns or shard['size'] != stat.st_size:
+                shard = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'devices': self._scan(relpath)}
+            updated[relpath] = shard
+        if updated != files:
+            try:
+                with open(index_path + '.tmp', 'w') as index_file:
+                    json.dump({'version': self.indexVersion, 'files': updated}, index_file)
+                os.replace(index_path + '.tmp', index_path)
+            except OSError as exc:
+                logging.debug(f'Database index not saved: {exc}')
+        return updated
+
+    def names(self):  # Names of all the devices, in database order
+        return [name for shard in self.index.values() for name, start, end in shard['devices']]
+
+    @staticmethod
+    def _entry_name(entry):  # First value of the entry, as the name read by _scan_entry
+        if isinstance(entry, dict) and entry:
+            name = next(iter(entry.values()))
+            return None if isinstance(name, (dict, list)) else str(name)
+        return None
+
+    def _load_shard(self, relpath):
+        data = read_database_file(os.path.join(self.db_path, relpath), self.cache)
+        if data is None:
+            return []
+        return data if isinstance(data, list) else [data]
+
+    def load(self, select=None):  # Yield the entries of the database, only the selected ones if select is given
+        for relpath, shard in self.index.items():
+            devices = shard['devices']
+            wanted = [device for device in devices if not select or device_selected(device[0], select)]
+            if not wanted:
+                continue
+            if len(wanted) == len(devices) or any(start is None for name, start, end in wanted):
+                entries = self._load_shard(relpath)
+                yield from select_entries(entries, select) if select else entries
+                continue
+            with open(os.path.join(self.db_path, relpath)) as db_file:
+                text = db_file.read()
+            entries = []
+            for name, start, end in wanted:  # All the slices are checked before the first one is yielded
+                try:
+                    entry = yaml.load(text[start:end], Loader=yaml_loaders()[0])
+                except yaml.YAMLError:
+                    entry = None  # e.g. an alias to an anchor of another entry
+                if not (isinstance(entry, list) and len(entry) == 1 and isinstance(entry[0], dict)
+                        and str(next(iter(entry[0].values()), None)) == name):
+                    entries = select_entries(self._load_shard(relpath), select)  # Not sliceable, load all the shard
+                    break
+                entries.append(entry[0])
+            yield from entries
+
+
+def merge_defaults(defaults, entry):  # Deep merge of two dictionaries, entry wins and its keys come first
+    # The values not overridden by entry are shared with defaults instead of copied (copy-on-write)
+    merged = {}
+    for key, value in entry.items():
+        base = defaults.get(key)
+        merged[key] = merge_defaults(base, value) if isinstance(base, dict) and isinstance(value, dict) else value
+    for key, value in defaults.items():
+        merged.setdefault(key, value)
+    return merged
+
+
+class Defaults:
+    """
+    Hierarchical defaults merged into the database entries: global -> group -> device.
+
+    The defaults file is a YAML dictionary with the optional keys 'global' (values for every device) and
+    'groups' (group name -> values). A device joins a group with the key 'group', a group can inherit
+    from another group with the same key. Dictionaries are merged key by key, lists and scalars of the
+    device replace the defaults. The defaults of each group are resolved once and shared by its devices.
+
+    @param defaults_path YAML file with the defaults
+    @param cache use the cache of the parsed YAML files, see load_database()
+    """
+
+    groupKey = 'group'
+
+    def __init__(self, defaults_path, cache=True):
+        self.defaults_path = str(defaults_path)
+        data = load_database(self.defaults_path, cache=cache) or {}
+        if not (isinstance(data, dict) and isinstance(data.get('global') or {}, dict)
+                and isinstance(data.get('groups') or {}, dict)
+                and all(isinstance(values or {}, dict) for values in (data.get('groups') or {}).values())):
+            raise RenderError('An error occurred while reading the defaults\n',
+                              "The defaults file must be a dictionary with the keys 'global' and 'groups'\n")
+        self.globals = data.get('global') or {}
+        self.groups = {str(name): values or {} for name, values in (data.get('groups') or {}).items()}
+        self.resolved = {}  # {group: merged defaults}
+
+    def resolve(self, group, chain=()):  # Return the merged defaults of a group, None is the global level
+        if group is None:
+            return self.globals
+        group = str(group)
+        merged = self.resolved.get(group)
+        if merged is None:
+            if group in chain:
+                raise RenderError('An error occurred while reading the defaults\n',
+                                  f"Group '{group}' inherits from itself: {' -> '.join(chain + (group,))}\n")
+            if group not in self.groups:
+                raise RenderError('An error occurred while reading the defaults\n', f"Unknown group '{group}'\n")
+            values = self.groups[group]
+            merged = merge_defaults(self.resolve(values.get(self.groupKey), chain + (group,)), values)
+            self.resolved[group] = merged
+        return merged
+
+    def apply(self, entries):  # Yield the entries merged with the defaults of their group
+        for entry in entries:
+            if isinstance(entry, dict):
+                entry = merge_defaults(self.resolve(entry.get(self.groupKey)), entry)
+            yield entry  # Anything else is reported by the render step
+
+
+@functools.lru_cache(maxsize=None)
+def template_cache_class():  # The class derives from Jinja2, it is created with the first Environment
+    class TemplateCache(jinja2.FileSystemBytecodeCache):
+        """
+        On-disk cache of the compiled templates, shared by validation, rendering and the worker processes.
+
+        Jinja2 already discards an entry when the checksum of the template source changes, the cache key
+        also contains the Environment options and the filter names because they change the compiled code.
+        """
 
-        # Final messagebox when configuration is correctly generated
-        end_msg = QtWidgets.QMessageBox()
-        end_msg.setIcon(QtWidgets.QMessageBox.Icon.Information)
-        end_msg.setWindowTitle('Task Finished')
-        end_msg.setText(f"\nProject '{self.projectEdit.text()}' completed!\n\n"
-                        'The files have been generated in the folder: \n'
-                        f"  '{str(out_path)}'\n")
-        end_msg.setDetailedText(report)
-        end_msg.setStandardButtons(QtWidgets.QMessageBox.StandardButton.Ok | QtWidgets.QMessageBox.StandardButton.Open)
-        result = end_msg.exec()
-        if result == QtWidgets.QMessageBox.StandardButton.Open:
-            self.openFile(str(out_path))
+        def __init__(self, directory, signature):
+            os.makedirs(directory, exist_ok=True)
+            super().__init__(directory)
+            self.signature = signature
 
+        def get_cache_key(self, name, filename=None):
+            return super().get_cache_key(f'{name}|{self.signature}', filename)
 
-def setValidFile(fileType, fileName, textField):
-    # Set error message for invalid file
-    errorMsg = f'< Not a valid {fileType} file >'
+    return TemplateCache
 
+
+@functools.lru_cache(maxsize=8)
+def create_environment(tp_path, cache=True, instrument=False):  # Create the Jinja2 Environment with the custom filters
+    # Environments are reused within the process, Jinja2 reloads a template only when its file changes
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(str(tp_path)), trim_blocks=True, lstrip_blocks=True)
+    filters = j2filters
+    if instrument:  # Separate Environment, the plain one has no wrapper overhead
+        filters = {name: instrument_filter(name, func) for name, func in j2filters.items()}
+    env.filters.update(filters)
+    env.globals.update({name: filters[name] for name in ('hosts', 'subnets', 'ipaddlist')})  # Also usable as functions
+    if cache:
+        signature = f"{__version__}|{env.trim_blocks}|{env.lstrip_blocks}|{','.join(sorted(env.filters))}"
+        try:
+            env.bytecode_cache = template_cache_class()(cache_folder(), signature)
+        except OSError as exc:
+            logging.debug(f'Compiled template cache disabled: {exc}')
+    return env
+
+
+def load_template(env, tp_name):  # Load and compile the Jinja2 template from the Environment
+    try:
+        return env.get_template(tp_name)
+    except jinja2.TemplateNotFound as exc:
+        errorText = f'{tp_name}: File not found\n'
+        errorArgs = f"File '{tp_name}' not found in {', '.join(env.loader.searchpath)}\n"
+        raise RenderError(errorText, errorArgs) from exc
+    except jinja2.TemplateSyntaxError as exc:
+        raise template_error(exc) from exc
+
+
+def template_error(exc):  # Convert a Jinja2 syntax exception into a RenderError for the user
+    errorText = ('An error occurred while reading Jinja2 template\n\n'
+                 'Please correct data and retry.\n')
+    errorArgs = ('Syntax check failed:\n'
+                 f' {exc.message} '
+                 f'in {exc.filename} at line {exc.lineno}')
+    return RenderError(errorText, errorArgs)
+
+
+def output_name(name, fileExt):  # File name of an output: name + extension, or a pattern like 'docs/{name}.md'
+    return fileExt.format(name=name) if '{' in fileExt else name + fileExt
+
+
+def check_output(fileExt):  # Raise RenderError if the file name pattern cannot be used, before the render starts
+    try:
+        output_name('R1', fileExt)
+    except (KeyError, IndexError, ValueError, AttributeError) as exc:
+        raise RenderError('An error occurred while reading the templates\n',
+                          f"Invalid output file name pattern '{fileExt}': {type(exc).__name__} {exc}\n"
+                          "The only field of a pattern is {name}, e.g. 'docs/{name}.md'\n") from exc
+
+
+def template_jobs(tp_file, fileExt):  # Return [(tp_file, fileExt)], one template or lists of templates and extensions
+    if not isinstance(tp_file, (list, tuple)):
+        check_output(fileExt)
+        return [(tp_file, fileExt)]
+    if isinstance(fileExt, str) or len(fileExt) != len(tp_file):
+        raise RenderError('An error occurred while reading the templates\n',
+                          'Every template needs its own output extension or file name pattern\n')
+    for ext in fileExt:
+        check_output(ext)
+    outputs = [output_name('{name}', ext) for ext in fileExt]  # '.txt' and '{name}.txt' are the same file
+    duplicates = sorted({output for output in outputs if outputs.count(output) > 1})
+    if duplicates:
+        raise RenderError('An error occurred while reading the templates\n',
+                          f"Several templates write the same output: {', '.join(duplicates)}\n")
+    return list(zip(tp_file, fileExt))
+
+
+def load_job(job_file, cache=True):  # Return (templates, extensions) of a job file, the templates are relative to the job file
+    # YAML list of {template: file, output: extension or pattern}, e.g. {template: doc.j2, output: 'docs/{name}.md'}
+    job = load_database(job_file, cache=cache)
+    if not (isinstance(job, list) and job and all(isinstance(item, dict) and item.get('template') for item in job)):
+        raise RenderError('An error occurred while reading the job\n',
+                          "The job file must be a list of dictionaries with the keys 'template' and 'output'\n")
+    folder = Path(job_file).parent
+    templates = [str(folder / item['template']) for item in job]
+    outputs = [str(item.get('output', '.txt')) for item in job]
+    template_jobs(templates, outputs)  # Checks the outputs
+    return templates, outputs
+
+
+def render_entry(input_tp, entry, fileExt):  # Render one dictionary of the database, return (filename, text)
+    try:
+        result = input_tp.render(entry)
+        out_file_name = output_name(next(iter(entry.values())), fileExt)
+    except ValueError as exc:
+        errorText = ('An error occurred while rendering the templates\n'
+                     'The YAML file must start with a list of dictionary\n\n'
+                     'Please correct data and retry.\n')
+        errorArgs = (str(traceback.format_exc()))
+        raise RenderError(errorText, errorArgs) from exc
+    except jinja2.UndefinedError as exc:
+        errorText = ('An error occurred while parsing Jinja2 template\n\n'
+                     'Please correct data and retry.\n')
+        errorArgs = exc.message
+        raise RenderError(errorText, errorArgs) from exc
+    return out_file_name, result
+
+
+def render_timed(input_tp, entry, fileExt):  # Same as render_entry(), plus the render time in seconds
+    start = time.perf_counter()
+    out_file_name, result = render_entry(input_tp, entry, fileExt)
+    return out_file_name, result, time.perf_counter() - start
+
+
+# Render worker processes: the templates are compiled once per process by the pool initializer
+_worker_jobs = []  # [(template, fileExt)]
+
+
+def _init_worker(tp_file, fileExt, cache):
+    global _worker_jobs
+    _worker_jobs = [(load_template(create_environment(Path(tp).parent, cache), Path(tp).name), ext)
+                    for tp, ext in template_jobs(tp_file, fileExt)]
+
+
+def _render_worker(entry):  # Every template for one entry, the entry is sent to the process once
+    return [render_timed(input_tp, entry, ext) for input_tp, ext in _worker_jobs]
+
+
+def render_parallel(tp_file, input_db, fileExt, workers, cache=True, chunksize=32):  # Render entries on a process pool, results keep database order
+    # Yield (filename, text, seconds) like render_timed()
+    # The entries are submitted in batches so a streamed database is never fully held in memory,
+    # the next batch is read while the workers render the current one
+    input_db = iter(input_db)
+    import concurrent.futures
+    batchsize = workers * chunksize * 2
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                      initargs=(tp_file, fileExt, cache))
+    try:
+        batch = list(itertools.islice(input_db, batchsize))
+        while batch:
+            results = executor.map(_render_worker, batch, chunksize=chunksize)
+            batch = list(itertools.islice(input_db, batchsize))
+            for outputs in results:
+                yield from outputs
+    finally:
+        executor.shutdown(cancel_futures=True)  # Closing the generator early drops the pending chunks
+
+
+def write_config(out_path, out_file_name, result):  # Write one rendered configuration inside the project folder
+    path = os.path.join(out_path, out_file_name)
+    try:
+        out_file = open(path, 'w')
+    except FileNotFoundError:  # File name pattern with sub-folders
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        out_file = open(path, 'w')
+    with out_file:
+        out_file.write(result)
+
+
+def remove_path(path):  # Remove a file or a folder, if it exists
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class OutputWriter:
+    """
+    Write the rendered configurations from a background thread, overlapping disk I/O with rendering.
+
+    The files go into a staging folder (or archive) next to the project which replaces the previous
+    project only when every configuration has been written, so a failed run leaves the old outputs untouched.
+    With inplace the files are written straight into the existing project folder (incremental build).
+    With store every distinct content is written once in a content-addressed folder (named by its sha256)
+    and the configurations are hard links to it, an output already linked to the same content is not touched.
+    The stored files are read-only because they are shared by every output with the same content.
+
+    @param out_path project folder
+    @param archive None for a folder of files, 'zip' or 'tar' for a single archive named after the project
+    @param inplace write inside out_path instead of a staging folder
+    @param store optional folder of the content-addressed store, on the same file system as out_path
+    @param queuesize maximum number of rendered configurations waiting to be written
+    """
+
+    archives = ('zip', 'tar')
+
+    def __init__(self, out_path, archive=None, inplace=False, store=None, queuesize=256):
+        if archive and inplace:
+            raise RenderError('An archive cannot be updated by an incremental build\n')
+        if archive and store:
+            raise RenderError('An archive cannot use the deduplicated output store\n')
+        self.target = f'{out_path}.{archive}' if archive else str(out_path)
+        self.staging = self.target if inplace else f'{self.target}.staging'
+        self.inplace = inplace
+        self.archive = archive
+        self.store = store
+        self.digests = set()  # Distinct contents written with the store
+        self.error = None
+        self.archiveFile = None
+        if archive == 'zip':
+            import zipfile
+            self.archiveFile = zipfile.ZipFile(self.staging, 'w', zipfile.ZIP_DEFLATED)
+        elif archive == 'tar':
+            import tarfile
+            self.archiveFile = tarfile.open(self.staging, 'w')
+        else:
+            if not inplace:
+                remove_path(self.staging)  # Left by an interrupted run
+            os.makedirs(self.staging, exist_ok=True)
+        self.queue = queue.Queue(queuesize)
+        self.thread = threading.Thread(target=self._run, name='OutputWriter', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tracebackobj):
+        if excType is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is None:  # After a failure the queue is only drained
+                try:
+                    self._write(*item)
+                except Exception as exc:
+                    self.error = exc
+
+    def _write(self, out_file_name, result):
+        if self.archive == 'zip':
+            self.archiveFile.writestr(out_file_name, result)
+        elif self.archive == 'tar':
+            import tarfile
+            data = result.encode()
+            info = tarfile.TarInfo(out_file_name)
+            info.size = len(data)
+            info.mtime = time.time()
+            self.archiveFile.addfile(info, io.BytesIO(data))
+        elif self.store is not None:
+            self._link(out_file_name, result)
+        else:
+            path = os.path.join(self.staging, out_file_name)
+            if self.inplace and os.path.isfile(path) and os.stat(path).st_nlink > 1:
+                os.remove(path)  # Never write through a hard link of the store
+            write_config(self.staging, out_file_name, result)
+
+    def _link(self, out_file_name, result):  # Link the output to the stored copy of its content
+        digest = hashlib.sha256(result.encode()).hexdigest()
+        self.digests.add(digest)
+        stored = os.path.join(self.store, digest[:2], digest)
+        path = os.path.join(self.staging, out_file_name)
+        try:
+            if os.path.samefile(stored, path):
+                return  # Content unchanged, nothing is written
+        except OSError:
+            pass
+        if not os.path.exists(stored):
+            os.makedirs(os.path.dirname(stored), exist_ok=True)
+            write_config(os.path.dirname(stored), f'{digest}.tmp', result)
+            os.chmod(f'{stored}.tmp', 0o444)
+            os.replace(f'{stored}.tmp', stored)
+        remove_path(f'{path}.tmp')
+        os.makedirs(os.path.dirname(path), exist_ok=True)  # File name pattern with sub-folders
+        try:
+            os.link(stored, f'{path}.tmp')
+        except OSError:  # Hard links not supported, e.g. store on another file system
+            shutil.copyfile(stored, f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+
+    def _stop(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.archiveFile is not None:
+            self.archiveFile.close()
+
+    def write(self, out_file_name, result):  # Queue one configuration, blocks while the queue is full
+        if self.error is not None:
+            raise self.error
+        self.queue.put((out_file_name, result))
+
+    def close(self):  # Wait for all the writes and move the staging outputs to the project
+        self._stop()
+        if self.error is not None:
+            if not self.inplace:
+                remove_path(self.staging)
+            raise self.error
+        if not self.inplace:
+            self._swap()
+
+    def abort(self):  # Stop writing and discard the staging outputs
+        self._stop()
+        if not self.inplace:
+            remove_path(self.staging)
+
+    def _swap(self):
+        old = f'{self.target}.old'
+        attempts = 0
+        while os.path.exists(self.target):  # Try multiple time to fix when file is already opened
+            try:
+                remove_path(old)
+                os.replace(self.target, old)
+            except PermissionError as exc:
+                attempts += 1
+                if attempts == 3:
+                    remove_path(self.staging)
+                    errorText = 'One of the files is already in use, please close the application and try again.\n'
+                    raise RenderError(errorText, str(exc.args)) from exc
+                logging.debug(str(exc.args))
+                time.sleep(1)
+        os.replace(self.staging, self.target)
+        remove_path(old)
+
+
+def prune_store(store):  # Remove the stored contents not linked by any output anymore, return how many
+    removed = 0
+    if not os.path.isdir(store):
+        return removed
+    for folder in os.scandir(store):
+        if not folder.is_dir():
+            continue
+        for entry in os.scandir(folder.path):
+            if entry.stat().st_nlink == 1:
+                os.chmod(entry.path, 0o644)  # Read-only files cannot be removed on Windows
+                os.remove(entry.path)
+                removed += 1
+    return removed
+
+
+class OutputDiff:
+    """
+    Compare the new outputs with the outputs of a previous run while they are rendered.
+
+    The hash, size and modification time of every output are cached in the project folder, an output is
+    read again from disk only when its hash changed (or the cache is missing or out of date), and the
+    line diff is computed only for the files that really differ. The diffs go into one unified diff file.
+
+    @param old_path folder of the previous outputs
+    @param bundle_path file where the unified diffs are written, created only if something changed
+    @param context lines of context around the changes
+    """
+
+    hashesFile = '.nepyh_hashes.json'
+
+    def __init__(self, old_path, bundle_path, context=3):
+        self.old_path = str(old_path)
+        self.bundle_path = bundle_path
+        self.context = context
+        try:
+            with open(os.path.join(self.old_path, self.hashesFile)) as hashes_file:
+                self.old_hashes = json.load(hashes_file)  # {filename: [sha256, size, mtime_ns]}
+        except (OSError, ValueError):
+            self.old_hashes = {}
+        self.hashes = {}  # {filename: sha256} of the new outputs
+        self.changed = []
+        self.added = []
+        self.unchanged = 0
+        self.bundle = None
+
+    def check(self, out_file_name, result):  # Compare one new output, call it before the output is written
+        digest = hashlib.sha256(result.encode()).hexdigest()
+        self.hashes[out_file_name] = digest
+        path = os.path.join(self.old_path, out_file_name)
+        cached = self.old_hashes.get(out_file_name)
+        if cached is not None and cached[0] == digest:
+            try:
+                stat = os.stat(path)
+                if [stat.st_size, stat.st_mtime_ns] == cached[1:]:
+                    self.unchanged += 1
+                    return
+            except OSError:
+                pass
+        try:
+            with open(path) as old_file:
+                old = old_file.read()
+        except OSError:
+            self.added.append(out_file_name)
+            return
+        if old == result:
+            self.unchanged += 1
+            return
+        import difflib
+        self.changed.append(out_file_name)
+        if self.bundle is None:
+            self.bundle = open(self.bundle_path, 'w')
+        for line in difflib.unified_diff(old.splitlines(True), result.splitlines(True),
+                                         f'a/{out_file_name}', f'b/{out_file_name}', n=self.context):
+            self.bundle.write(line if line.endswith('\n') else line + '\n\\ No newline at end of file\n')
+
+    def old_names(self):  # Names of the previous outputs
+        if self.old_hashes:
+            return set(self.old_hashes)
+        names = set()
+        for root, dirs, files in os.walk(self.old_path):
+            dirs[:] = [folder for folder in dirs if not folder.startswith('.')]
+            for name in files:
+                if not name.startswith('.'):
+                    names.add(os.path.relpath(os.path.join(root, name), self.old_path).replace(os.sep, '/'))
+        return names
+
+    def close(self):
+        if self.bundle is not None:
+            self.bundle.close()
+        elif os.path.exists(self.bundle_path):
+            os.remove(self.bundle_path)  # Left by a previous run, there is nothing to show now
+
+    def save(self, out_path, keep=()):  # Save the hashes of the outputs in out_path, and of the files in keep left on disk
+        sameFolder = os.path.abspath(self.old_path) == os.path.abspath(out_path)
+        cache = {}
+        for name in set(keep) | self.hashes.keys():
+            path = os.path.join(out_path, name)
+            try:
+                stat = os.stat(path)
+                digest = self.hashes.get(name)
+                if digest is None:
+                    cached = self.old_hashes.get(name) if sameFolder else None
+                    if cached is not None and cached[1:] == [stat.st_size, stat.st_mtime_ns]:
+                        digest = cached[0]
+                    else:  # Hashes of another folder, or out of date
+                        with open(path, 'rb') as kept_file:
+                            digest = hashlib.sha256(kept_file.read()).hexdigest()
+            except OSError:
+                continue
+            cache[name] = [digest, stat.st_size, stat.st_mtime_ns]
+        tmp_file = os.path.join(out_path, self.hashesFile + '.tmp')
+        with open(tmp_file, 'w') as hashes_file:
+            json.dump(cache, hashes_file)
+        os.replace(tmp_file, os.path.join(out_path, self.hashesFile))
+
+    def summary(self, removed, kept=0, limit=20):  # Return the lines of the change report, kept outputs were not rendered
+        lines = [f"Changes since the previous run: {len(self.changed)} changed, {len(self.added)} added, "
+                 f"{len(removed)} removed, {self.unchanged + kept} unchanged"]
+        for title, names in (('Changed', self.changed), ('Added', self.added), ('Removed', sorted(removed))):
+            if names:
+                more = f' ... and {len(names) - limit} more' if len(names) > limit else ''
+                lines.append(f"  {title}: {', '.join(names[:limit])}{more}")
+        if self.changed:
+            lines.append(f"  Diff of the changed files: '{self.bundle_path}'")
+        return lines
+
+
+templateExtensions = ('.j2', '.jinja', '.jinja2')
+
+
+def template_sources(env, tp_name, missing=None):  # Return [(name, source, filename)] of the template and of all the templates it uses
+    # The names of the templates used but not found are appended to the missing list, if given
+    import jinja2.meta
+    sources = []
+    pending = [(tp_name, False)]
+    seen = set()
+    while pending:
+        name, dynamic = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        try:
+            source, filename = env.loader.get_source(env, name)[:2]
+            ast = env.parse(source, name, filename)
+        except jinja2.TemplateNotFound:
+            if missing is not None and not dynamic:
+                missing.append(name)
+            continue  # Reported by the render step
+        except (jinja2.TemplateSyntaxError, UnicodeDecodeError) as exc:
+            if dynamic:  # Maybe never included, the render step reports it if it is
+                continue
+            if isinstance(exc, UnicodeDecodeError):
+                raise RenderError('An error occurred while reading Jinja2 template\n\n'
+                                  'Please correct data and retry.\n', f'{name}: {exc}') from exc
+            raise template_error(exc) from exc
+        sources.append((name, source, filename))
+        for ref in jinja2.meta.find_referenced_templates(ast):
+            if ref is None:  # Include with a dynamic name, any template of the folder may be used
+                pending.extend((other, True) for other in env.list_templates(extensions=templateExtensions))
+            else:
+                pending.append((ref, False))
+    return sources
+
+
+def template_fingerprint(env, tp_name, sources=None):  # Hash of the template, of all the templates it includes and of the filters
+    digest = hashlib.sha256(__version__.encode())
+    for name, source, filename in sources or template_sources(env, tp_name):
+        digest.update(f'{name}\0{source}\0'.encode())
+    return digest.hexdigest()
+
+
+def _path(node):  # ('mgt', 'ip') of mgt.ip or mgt['ip'], None if it is not a name with constant keys
+    if isinstance(node, jinja2.nodes.Name):
+        return (node.name,) if node.ctx == 'load' else None
+    if isinstance(node, jinja2.nodes.Getattr):
+        key = node.attr
+    elif isinstance(node, jinja2.nodes.Getitem) and isinstance(node.arg, jinja2.nodes.Const) \
+            and isinstance(node.arg.value, str):
+        key = node.arg.value
+    else:
+        return None
+    path = _path(node.node)
+    return path and path + (key,)
+
+
+def _guards(test):  # Paths checked by an if condition, the block can use them only when they are defined
+    path = _path(test.node if isinstance(test, jinja2.nodes.Test) else test)
+    if path is not None:
+        yield path
+    elif isinstance(test, (jinja2.nodes.And, jinja2.nodes.Or)):
+        yield from _guards(test.left)
+        yield from _guards(test.right)
+    elif isinstance(test, jinja2.nodes.Not):
+        yield from _guards(test.node)
+
+
+def _strict_use(node, parent):  # True if the use of the value raises UndefinedError when it is missing
+    if isinstance(parent, (jinja2.nodes.Getattr, jinja2.nodes.Getitem, jinja2.nodes.Call)) and parent.node is node:
+        return True  # Attribute, item or call
+    if isinstance(parent, jinja2.nodes.Filter) and parent.node is node:
+        return parent.name in j2filters  # The IP filters need an address, the Jinja2 ones accept Undefined
+    if isinstance(parent, jinja2.nodes.Call) and isinstance(parent.node, jinja2.nodes.Name):
+        return parent.node.name in j2filters and node in parent.args  # e.g. hosts(my_net)
+    if isinstance(parent, jinja2.nodes.BinExpr) and not isinstance(parent, (jinja2.nodes.And, jinja2.nodes.Or)):
+        return True  # Arithmetic
+    return isinstance(parent, (jinja2.nodes.Neg, jinja2.nodes.Pos))
+
+
+def _name_uses(node, guarded, uses, parent=None):  # Append (path, strict) for every unguarded use of the variables
+    path = _path(node)
+    if path is not None:
+        if not any(path[:len(guard)] == guard for guard in guarded):
+            uses.append((path, _strict_use(node, parent)))
+            uses.extend((path[:length], True) for length in range(1, len(path)))  # The parents are read
+    elif isinstance(node, (jinja2.nodes.Filter, jinja2.nodes.Test)) and _path(node.node) is not None \
+            and node.name in ('default', 'd', 'defined', 'undefined'):
+        path = _path(node.node)  # It may be missing, its parents not
+        if not any(path[:len(guard)] == guard for guard in guarded):
+            uses.extend((path[:length], True) for length in range(1, len(path)))
+        for child in node.args + node.kwargs:
+            _name_uses(child, guarded, uses, node)
+    elif isinstance(node, jinja2.nodes.If):  # Only the body of the block is guarded by the condition
+        _name_uses(node.test, guarded, uses, node)
+        for child in node.body:
+            _name_uses(child, guarded | set(_guards(node.test)), uses, node)
+        for child in node.elif_ + node.else_:
+            _name_uses(child, guarded, uses, node)
+    elif isinstance(node, jinja2.nodes.CondExpr):
+        _name_uses(node.test, guarded, uses, node)
+        _name_uses(node.expr1, guarded | set(_guards(node.test)), uses, node)
+        if node.expr2 is not None:
+            _name_uses(node.expr2, guarded, uses, node)
+    elif isinstance(node, jinja2.nodes.And):  # 'mgt is defined and mgt.ip'
+        _name_uses(node.left, guarded, uses, node)
+        _name_uses(node.right, guarded | set(_guards(node.left)), uses, node)
+    else:
+        for child in node.iter_child_nodes():
+            _name_uses(child, guarded, uses, node)
+
+
+def template_variables(env, tp_name, sources=None):  # Return (required, optional) paths the templates read from each entry
+    # The paths are tuples of keys: ('hostname',) or ('mgt', 'ip') for mgt.ip
+    # Required paths raise UndefinedError when missing (attribute, item, call, arithmetic or IP filter on them)
+    # Optional paths are printed, iterated or passed to the other filters, a missing one renders empty
+    # The uses checked with 'is defined', 'default' or inside the block of an if condition on them are left out
+    import jinja2.meta
+    names, uses = set(), []
+    for name, source, filename in sources or template_sources(env, tp_name):
+        ast = env.parse(source, name, filename)
+        names |= jinja2.meta.find_undeclared_variables(ast)
+        _name_uses(ast, frozenset(), uses)
+    names -= set(env.globals)
+    required = {path for path, strict in uses if strict and path[0] in names}
+    return required, {path for path, strict in uses if path[0] in names} - required
+
+
+def _missing(entry, path):  # True if the entry does not have the path, values that are not dictionaries are not checked
+    value = entry
+    for key in path:
+        if not isinstance(value, dict):
+            return False
+        if key not in value:
+            return not hasattr(value, key)  # e.g. 'items' is an attribute of every dictionary
+        value = value[key]
+    return False
+
+
+def validate_database(templates, entries):  # Check all the entries before rendering, return (errors, warnings)
+    # templates is a list of (env, tp_name), the entries must provide the variables of all of them
+    required, optional = set(), set()
+    for env, tp_name in templates:
+        variables = template_variables(env, tp_name)
+        required |= variables[0]
+        optional |= variables[1]
+    optional -= required
+    errors, warnings = [], []
+    if not isinstance(entries, (list, collections.abc.Iterator)):
+        errors.append('The YAML file must start with a list of dictionary')
+        return errors, warnings
+    seen = set()
+    for number, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict) or not entry:
+            errors.append(f'Entry {number}: not a dictionary: {entry!r:.60}')
+            continue
+        name = next(iter(entry.values()))
+        if not isinstance(name, str):
+            errors.append(f'Entry {number}: the first value is the file name, it must be a string: {name!r:.60}')
+            continue
+        if name in seen:
+            warnings.append(f"Device '{name}': defined more than once, the last one overwrites the others")
+        seen.add(name)
+        missing = sorted('.'.join(path) for path in required if _missing(entry, path))
+        if missing:
+            errors.append(f"Device '{name}': missing {', '.join(missing)}")
+        missing = sorted('.'.join(path) for path in optional if _missing(entry, path))
+        if missing:
+            warnings.append(f"Device '{name}': missing {', '.join(missing)} (rendered empty)")
+    return errors, warnings
+
+
+def entry_fingerprint(entry):  # Hash of one dictionary of the database
+    return hashlib.sha256(repr(entry).encode()).hexdigest()
+
+
+def load_manifest(out_path, tp_hash, fileExt):  # Return ({filename: entry hash}, invalidated) of the previous incremental build
+    # invalidated is True when the template or the extension changed: every output must be rendered again,
+    # the previous entries are still returned so the outputs of the removed devices can be deleted
+    try:
+        with open(os.path.join(out_path, manifestFile)) as manifest:
+            data = json.load(manifest)
+    except (OSError, ValueError):
+        return {}, False
+    return data.get('entries', {}), data.get('template') != tp_hash or data.get('fileExt') != fileExt
+
+
+def save_manifest(out_path, tp_hash, fileExt, entries):
+    tmp_file = os.path.join(out_path, manifestFile + '.tmp')
+    with open(tmp_file, 'w') as manifest:
+        json.dump({'template': tp_hash, 'fileExt': fileExt, 'entries': entries}, manifest)
+    os.replace(tmp_file, os.path.join(out_path, manifestFile))
+
+
+def config_gen(db_path, tp_file, out_path, fileExt, workers=1, stream=False, incremental=False, cache=True,
+               archive=None, select=None, defaults=None, dedup=False, validate=False, diff=None, progress=None,
+               cancel=None, stats=None):  # This function cover the config generator, return the report
+    """
+    Render the template for every entry of the database and write the outputs in out_path.
+
+    @param tp_file template file, or list of templates all rendered for each entry in the same pass
+    @param fileExt extension added to the name of the outputs or pattern like 'docs/{name}.md',
+           a list with one item per template when tp_file is a list
+
+    @param select optional list of glob patterns, only the devices whose name matches one are rendered
+           and the outputs of the other devices are left untouched
+    @param defaults optional YAML file of global and group defaults merged into the entries, see Defaults
+    @param dedup store each distinct output once in the '.nepyh_store' folder next to the project and hard link
+           the configurations to it, see OutputWriter
+    @param validate check every entry against the variables used by the template before rendering, the run
+           fails with the list of all the invalid entries, see validate_database()
+    @param diff report the changes compared with the previous outputs instead of listing every output:
+           True for the previous outputs of this project or the path of another project folder,
+           the line diffs are saved in '<project>.diff', see OutputDiff
+
+    @param progress optional callable(done, total) called after each configuration, total is None when unknown
+    @param cancel optional threading.Event, when set the run stops with RenderCancelled
+    @param stats optional RenderStats filled with the timings of the run, the filters are instrumented too
+    """
+    global _filterStats
+    instrument = stats is not None
+    if stats is None:
+        stats = RenderStats()
+
+    report = []  # Initialize final report to the user for each config_gen() cycle
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)  # One log line per device only when debugging
+
+    def info(infomsg):
+        report.append(infomsg)
+        logging.info(infomsg)
+
+    with stats.stage('template'):
+        jobs = template_jobs(tp_file, fileExt)
+        info('Create Jinja2 Environment...')
+        envs = [(create_environment(Path(tp).parent, cache, instrument), Path(tp).name) for tp, ext in jobs]
+
+        info('Load Jinja2 Template...' if len(jobs) == 1 else f'Load {len(jobs)} Jinja2 Templates...')
+        templates = [(load_template(env, tp_name), ext) for (env, tp_name), (tp, ext) in zip(envs, jobs)]
+
+    def open_database():  # A streamed database is parsed again at every call
+        entries = iter_database(db_path, select, cache) if stream else load_database(db_path, select, cache)
+        if dbDefaults is not None:
+            merged = dbDefaults.apply(entries)
+            entries = list(merged) if isinstance(entries, list) else merged
+        return entries
+
+    with stats.stage('database'):
+        info('Stream database...' if stream else 'Load database...')  # Streamed entries are parsed while rendering
+        dbDefaults = None
+        if defaults:
+            info('Merge defaults...')
+            dbDefaults = Defaults(defaults, cache)
+        input_db = open_database()
+
+    if validate:
+        # One quick pass over all the entries, so a database that does not match the template fails before rendering
+        with stats.stage('validate'):
+            info('Validate database...')
+            errors, warnings = validate_database(envs, open_database() if stream else input_db)
+        for warning in warnings[:10]:
+            logging.warning(warning)
+        if len(warnings) > 10:
+            logging.warning(f'... {len(warnings) - 10} more warnings')
+        report.extend(warnings)
+        if errors:
+            errorText = (f'The database does not match the template, {len(errors)} entries with errors\n\n'
+                         'Please correct data and retry.\n')
+            raise RenderError(errorText, '\n'.join(errors) + '\n')
+
+    if incremental:
+        # Only the entries whose data or template changed since the previous build are rendered
+        info('Compare with previous build...')
+        os.makedirs(out_path, exist_ok=True)
+        tp_hash = template_fingerprint(*envs[0])
+        if len(envs) > 1:  # Any template change renders every output again
+            tp_hash = hashlib.sha256(repr([template_fingerprint(*env) for env in envs]).encode()).hexdigest()
+        manifestExt = fileExt if isinstance(fileExt, str) else list(fileExt)
+        old_manifest, invalidated = load_manifest(out_path, tp_hash, manifestExt)
+        if invalidated:  # Every output is rendered again, the old names are kept to remove the ones left over
+            old_manifest = dict.fromkeys(old_manifest)
+        new_manifest = {}
+        unchanged = []
+
+        def changed_entries(entries):
+            for entry in entries:
+                try:
+                    name = next(iter(entry.values()))
+                    out_file_names = [output_name(name, ext) for tp, ext in jobs]
+                except Exception:
+                    yield entry  # Not a valid entry, the render step reports the error
+                    continue
+                digest = entry_fingerprint(entry)
+                for out_file_name in out_file_names:
+                    new_manifest[out_file_name] = digest
+                if all(old_manifest.get(out_file_name) == digest
+                       and os.path.exists(os.path.join(out_path, out_file_name)) for out_file_name in out_file_names):
+                    unchanged.extend(out_file_names)
+                else:
+                    yield entry
+
+        input_db = changed_entries(input_db)
+        if not stream:
+            with stats.stage('compare'):
+                input_db = list(input_db)  # The database is already in memory, this gives the number of outputs
+
+    total = len(input_db) * len(jobs) if isinstance(input_db, list) else None
+
+    # Render the templates with data and write the output, each entry is rendered by every template in turn
+    cacheInfo = filter_stats()
+    if workers > 1:
+        info(f'Rendering templates on {workers} processes...')
+        rendered = render_parallel(tp_file, input_db, fileExt, workers, cache)
+    else:
+        info('Rendering templates...')
+        rendered = (render_timed(input_tp, entry, ext) for entry in input_db for input_tp, ext in templates)
+    store = os.path.join(os.path.dirname(os.path.abspath(out_path)), '.nepyh_store') if dedup else None
+    writer = OutputWriter(out_path, archive, inplace=incremental or bool(select and not archive), store=store)
+    changes = OutputDiff(out_path if diff is True else diff, f'{out_path}.diff') if diff else None
+    _filterStats = stats if instrument else None
+    try:
+        with contextlib.closing(rendered), stats.stage('render'):
+            for done, (out_file_name, result, seconds) in enumerate(rendered, 1):
+                if cancel is not None and cancel.is_set():
+                    raise RenderCancelled()
+                if changes is not None:
+                    changes.check(out_file_name, result)  # Before an in place write replaces the old file
+                writer.write(out_file_name, result)
+                stats.add_device(out_file_name, seconds)
+                if changes is None:  # Otherwise the report has the summary of the changes
+                    report.append(f"Configuration '{out_file_name}' created...")
+                if debug:
+                    logging.debug(f"Configuration '{out_file_name}' created...")
+                elif done % 1000 == 0:  # Sampled progress in the log
+                    logging.info(f'{done} configurations rendered...')
+                if progress is not None:
+                    progress(done, total)
+    except BaseException:
+        writer.abort()
+        if changes is not None:
+            changes.close()
+        raise
+    finally:
+        _filterStats = None
+    with stats.stage('write'):  # Time left to flush the queue and move the outputs in place
+        writer.close()
+    info(f'{stats.devices} configurations created...')
+
+    removed = []
+    if incremental:
+        if select:  # Only a part of the database has been read, the other outputs are kept
+            new_manifest = {**old_manifest, **new_manifest}
+        removed = sorted(old_manifest.keys() - new_manifest.keys())
+        for out_file_name in removed:  # Devices removed from the database
+            try:
+                os.remove(os.path.join(out_path, out_file_name))
+            except FileNotFoundError:
+                pass
+            info(f"Configuration '{out_file_name}' removed...")
+        save_manifest(out_path, tp_hash, manifestExt, new_manifest)
+        info(f'{len(unchanged)} configurations unchanged...')
+
+    if changes is not None:
+        changes.close()
+        if not (incremental or select):
+            removed = changes.old_names() - changes.hashes.keys()
+        if not archive:
+            # Unchanged outputs of an incremental build, and the outputs outside the selection, keep their hash
+            changes.save(out_path, changes.old_names() if select else unchanged if incremental else ())
+        for line in changes.summary(removed, len(unchanged) if incremental else 0):
+            info(line)
+
+    if store is not None:
+        info(f'{len(writer.digests)} distinct contents stored...')
+        logging.debug(f'{prune_store(store)} unused contents removed from the store')
+
+    if workers <= 1:  # Worker processes have their own cache
+        stats.cache = {'hits': filter_stats().hits - cacheInfo.hits, 'misses': filter_stats().misses - cacheInfo.misses}
+    logging.debug(stats.summary())
+
+    return '\n'.join(report) + '\n'
+
+
+class WatchSession:
+    """
+    Keep the database and the compiled template in memory between the renders of watch().
+
+    The database is parsed again only when its file changes and only the entries whose data changed
+    are rendered, a change of the template or of one of the templates it uses renders every entry.
+    The outputs are updated in place together with the manifest of the incremental build.
+    """
+
+    def __init__(self, db_path, tp_file, out_path, fileExt, cache=True, defaults=None):
+        self.db_path = str(db_path)
+        self.defaults = str(defaults) if defaults else None
+        self.tp_name = Path(tp_file).name
+        self.out_path = out_path
+        self.fileExt = fileExt
+        check_output(fileExt)
+        self.cache = cache
+        self.env = create_environment(Path(tp_file).parent, cache)
+        self.input_tp = None
+        self.tp_hash = None
+        self.tp_files = [str(tp_file)]  # Completed with the included templates once it is loaded
+        self.entries = None  # {filename: (entry, hash)} in database order
+        self.rendered = None  # {filename: hash} of the outputs on disk
+        self.mtimes = {}
+        self.failed = False
+
+    def changed_files(self):  # Return the watched files modified, added or removed since the previous call
+        mtimes = {}
+        db_files = database_files(self.db_path) + ([self.defaults] if self.defaults else [])
+        for path in db_files + self.tp_files:  # The shards of a folder can come and go
+            try:
+                stat = os.stat(path)
+                mtimes[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                mtimes[path] = None
+        changed = [path for path in mtimes.keys() | self.mtimes.keys() if self.mtimes.get(path, False) != mtimes.get(path)]
+        self.mtimes = mtimes
+        return changed
+
+    def refresh(self):  # Render what changed since the previous call, return the report lines
+        changed = self.changed_files()
+        if not changed:  # Also after an error, the files are loaded again only when one of them changes
+            return []
+        reload_tp = self.input_tp is None or self.failed or any(path in self.tp_files for path in changed)
+        reload_db = self.entries is None or self.failed or any(path not in self.tp_files for path in changed)
+        self.failed = True  # Until the refresh completes, then a change of any file reloads everything
+        report = []
+
+        if reload_tp:
+            try:
+                input_tp = load_template(self.env, self.tp_name)  # Recompiled by Jinja2 only if the file changed
+                missing = []
+                sources = template_sources(self.env, self.tp_name, missing)
+            except RenderError as exc:
+                filename = getattr(exc.__cause__, 'filename', None)  # The included template with the syntax error
+                if filename and filename not in self.tp_files:
+                    self.tp_files.append(filename)
+                    self.changed_files()  # Start tracking it
+                raise
+            tp_hash = template_fingerprint(self.env, self.tp_name, sources)
+            self.tp_files = [filename for name, source, filename in sources]
+            # The included templates not found yet are watched too, their creation renders again
+            self.tp_files += [os.path.join(folder, name) for name in missing for folder in self.env.loader.searchpath]
+            self.changed_files()  # Start tracking new included templates
+            if self.rendered is None:
+                self.rendered, invalidated = load_manifest(self.out_path, tp_hash, self.fileExt)
+                if invalidated:
+                    self.rendered = dict.fromkeys(self.rendered)  # Rendered again, the old names are removed if unused
+            elif tp_hash != self.tp_hash:
+                self.rendered = dict.fromkeys(self.rendered)  # Every output must be rendered again
+                report.append('Template changed...')
+            self.input_tp, self.tp_hash = input_tp, tp_hash
+
+        if reload_db:
+            entries = {}
+            input_db = load_database(self.db_path, cache=self.cache)
+            if self.defaults:
+                input_db = Defaults(self.defaults, self.cache).apply(input_db)
+            for entry in input_db:
+                try:
+                    out_file_name = output_name(next(iter(entry.values())), self.fileExt)
+                except Exception:
+                    render_entry(self.input_tp, entry, self.fileExt)  # Raises the error of a YAML not made of dictionaries
+                    raise RenderError('An error occurred while reading the database\n', f'Invalid entry: {entry!r}\n')
+                entries[out_file_name] = (entry, entry_fingerprint(entry))
+            self.entries = entries
+
+        with OutputWriter(self.out_path, inplace=True) as writer:
+            for out_file_name, (entry, digest) in self.entries.items():
+                if self.rendered.get(out_file_name) != digest or not os.path.exists(
+                        os.path.join(self.out_path, out_file_name)):
+                    writer.write(*render_entry(self.input_tp, entry, self.fileExt))
+                    self.rendered[out_file_name] = digest
+                    report.append(f"Configuration '{out_file_name}' created...")
+        for out_file_name in sorted(self.rendered.keys() - self.entries.keys()):  # Devices removed from the database
+            remove_path(os.path.join(self.out_path, out_file_name))
+            del self.rendered[out_file_name]
+            report.append(f"Configuration '{out_file_name}' removed...")
+        save_manifest(self.out_path, self.tp_hash, self.fileExt, self.rendered)
+        self.failed = False
+        return report
+
+
+def _start_observer(paths, wake):  # Wake the watch loop on file system events, None if watchdog is not installed
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wake.set()
+
+    folders = {}  # {folder: recursive}
+    for path in paths:
+        if os.path.isdir(path):  # Sharded database
+            folders[os.path.abspath(path)] = True
+        else:
+            folders.setdefault(os.path.dirname(os.path.abspath(path)), False)
+    observer = Observer()
+    for folder, recursive in folders.items():
+        if os.path.isdir(folder):  # Not the folder of a missing include, the loop checks the files every second anyway
+            observer.schedule(Handler(), folder, recursive=recursive)
+    observer.start()
+    return observer
+
+
+def watch(db_path, tp_file, out_path, fileExt, interval=0.2, cache=True, stop=None,
+          defaults=None):  # Re-render on every change
+    """
+    Watch the database, the template and the templates it uses, and update the outputs after every change.
+
+    File system events are used when the optional watchdog package is installed, otherwise the files are
+    polled every interval seconds. Errors are logged and the previous outputs are kept until the next change.
+
+    @param stop optional threading.Event ending the loop, otherwise it runs until KeyboardInterrupt
+    """
+    os.makedirs(out_path, exist_ok=True)
+    session = WatchSession(db_path, tp_file, out_path, fileExt, cache, defaults)
+    wake = threading.Event()
+    observer = False  # Started after the first render, when the included templates are known
+    try:
+        while stop is None or not stop.is_set():
+            start = time.perf_counter()
+            try:
+                report = session.refresh()
+            except RenderError as exc:
+                logging.error(exc.errorText + exc.errorArgs)
+            except OSError as exc:
+                logging.error(str(exc))
+            else:
+                level = logging.DEBUG if len(report) > 10 else logging.INFO  # Only small updates are detailed
+                for line in report:
+                    logging.log(level, line)
+                if report:
+                    logging.info(f'Outputs updated in {time.perf_counter() - start:.3f}s, watching for changes...')
+            if observer is False:
+                paths = [str(db_path)] + ([str(defaults)] if defaults else []) + session.tp_files
+                observer = _start_observer(paths, wake)
+                if observer is None:
+                    logging.info(f'Polling for changes every {interval}s (install watchdog for file system events)')
+            wake.wait(interval if observer is None else 1.0)
+            wake.clear()
+    finally:
+        if observer:
+            observer.stop()
+            observer.join()
+
+
+class RenderService:
+    """
+    Database and templates kept in memory between the renders of serve(), the files are checked for
+    changes at most every interval seconds and reloaded only when they changed.
+
+    @param db_path database file or folder (sharded database)
+    @param tp_file default template, the other templates of its folder can be requested by name
+    @param defaults optional YAML file of global and group defaults merged into the entries
+    """
+
+    def __init__(self, db_path, tp_file, fileExt='', cache=True, defaults=None, interval=0.2):
+        self.db_path = str(db_path)
+        self.tp_name = Path(tp_file).name
+        self.fileExt = fileExt
+        check_output(fileExt)
+        self.defaults = str(defaults) if defaults else None
+        self.interval = interval
+        self.cache = cache
+        self.env = create_environment(Path(tp_file).parent, cache)
+        self.entries = None  # {device name: entry} in database order
+        self.signature = None
+        self.checked = 0
+        self.lock = threading.Lock()  # Renders run on the threads of the executor
+
+    def _signature(self):  # Modification time and size of the database files
+        signature = []
+        for path in database_files(self.db_path) + ([self.defaults] if self.defaults else []):
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return signature
+
+    def devices(self):  # Return {device name: entry}, the database is reloaded if one of its files changed
+        with self.lock:
+            if time.monotonic() - self.checked >= self.interval:
+                signature = self._signature()
+                if signature != self.signature:
+                    input_db = load_database(self.db_path, cache=self.cache)
+                    if self.defaults:
+                        input_db = Defaults(self.defaults, self.cache).apply(input_db)
+                    entries = {}
+                    for entry in input_db:
+                        if not isinstance(entry, dict) or not entry:
+                            raise RenderError('An error occurred while reading the database\n',
+                                              f'Invalid entry: {entry!r:.60}\n')
+                        entries[str(next(iter(entry.values())))] = entry
+                    self.entries, self.signature = entries, signature
+                    logging.info(f'Database loaded, {len(entries)} devices')
+                self.checked = time.monotonic()
+            return self.entries
+
+    def render(self, device, tp_name=None):  # Return (filename, text) of one device, KeyError if it is unknown
+        entry = self.devices()[device]
+        # Jinja2 keeps the compiled template and compiles it again only when one of its files changed
+        return render_entry(load_template(self.env, tp_name or self.tp_name), entry, self.fileExt)
+
+
+async def _serve_client(service, executor, reader, writer):  # Answer one HTTP request
+    import asyncio
+    import urllib.parse
+    status, contentType, body = 400, 'text/plain', 'Bad request\n'
+    try:
+        request = await reader.readuntil(b'\r\n\r\n')
+        method, target, version = request.split(b'\r\n', 1)[0].decode('latin-1').split(' ')
+        url = urllib.parse.urlsplit(target)
+        query = urllib.parse.parse_qs(url.query)
+        loop = asyncio.get_running_loop()
+        if method != 'GET':
+            status, body = 405, 'Only GET is supported\n'
+        elif url.path == '/render' and 'device' in query:
+            tp_name = query.get('template', [None])[0]
+            if tp_name not in (None, service.tp_name) and os.path.splitext(tp_name)[1].lower() not in templateExtensions:
+                status, body = 404, f"Unknown template '{tp_name}', only {', '.join(templateExtensions)} files are served\n"
+            else:
+                out_file_name, body = await loop.run_in_executor(executor, service.render, query['device'][0], tp_name)
+                status = 200
+        elif url.path == '/devices':
+            devices = await loop.run_in_executor(executor, service.devices)
+            status, contentType, body = 200, 'application/json', json.dumps(list(devices))
+        else:
+            status, body = 404, 'Use /render?device=NAME[&template=NAME] or /devices\n'
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+        pass  # Bad request
+    except KeyError as exc:
+        status, body = 404, f'Unknown device {exc}\n'
+    except RenderError as exc:
+        status, body = 422, exc.errorText + exc.errorArgs
+    except Exception as exc:  # The service keeps running, the error goes to the client and the log
+        logging.exception('Render request failed')
+        status, body = 500, f'{type(exc).__name__}: {exc}\n'
+    data = body.encode()
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+              422: 'Unprocessable Entity', 500: 'Internal Server Error'}[status]
+    writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: {contentType}; charset=utf-8\r\n'
+                 f'Content-Length: {len(data)}\r\nConnection: close\r\n\r\n'.encode() + data)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+
+async def _serve(service, address, workers):
+    import asyncio
+    import concurrent.futures
+    executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='Render')
+    handler = functools.partial(_serve_client, service, executor)
+    if '/' in address:  # Unix socket
+        server = await asyncio.start_unix_server(handler, address)
+    else:
+        host, sep, port = address.rpartition(':')
+        server = await asyncio.start_server(handler, host or '127.0.0.1', int(port))
+    logging.info(f'Render server listening on {address}, e.g. GET /render?device=NAME')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def serve(db_path, tp_file, address, fileExt='', cache=True, defaults=None,
+          workers=4):  # Serve on-demand renders over HTTP, until KeyboardInterrupt
+    """
+    Long running render service: the database is parsed and the templates compiled once, then every request
+    renders a single device from memory. The files are reloaded when they change.
+
+    GET /render?device=NAME[&template=NAME] returns the configuration, GET /devices the JSON list of devices.
+
+    @param address 'PORT' or 'HOST:PORT' (default host 127.0.0.1), or the path of a Unix socket
+    @param workers number of threads rendering the requests concurrently
+    """
+    import asyncio
+    service = RenderService(db_path, tp_file, fileExt, cache, defaults)
+    service.devices()  # Parse the database before the first request, errors stop the service here
+    load_template(service.env, service.tp_name)
+    netaddr.__name__  # Loaded before the threads of the executor, the lazy loading is not thread-safe before Python 3.12
+    asyncio.run(_serve(service, str(address), workers))
+
+
+def validate_file(fileType, fileName):  # Check if a file can be used as Database ('YAML') or Template ('JINJA')
     # Validate YAML file
     if fileType == 'YAML':
+        if os.path.isdir(fileName):  # Sharded database, every shard is parsed while the index is built
+            try:
+                return bool(ShardedDatabase(fileName).index)
+            except Exception:
+                return False
+        if database_format(fileName) != 'yaml':
+            try:
+                return isinstance(read_database_file(fileName), (list, dict))
+            except Exception:
+                return False
         try:
-            # Load the file as YAML
-            yaml.load(open(fileName), Loader=yaml.SafeLoader)
-            textField.setText(fileName)
-        except:
-            textField.setText(errorMsg)
+            # Parse the file as YAML, only the events are checked and no Python object is built
+            with open(fileName) as db_file:
+                for event in yaml.parse(db_file, Loader=yaml_loaders()[0]):
+                    pass
+            return True
+        except Exception:
+            return False
 
     # Validate JINJA file
     elif fileType == 'JINJA':
+        # YAML files can also be loaded as Jinja template without errors
+        # try to understand if the file extension is of a YAML file
+        root, ext = os.path.splitext(fileName)
+        if ext.lower() in ['.yaml', '.yml']:
+            return False
         try:
-            # Load the file as Jinja template
-            env = jinja2.Environment()
-            with open(fileName) as template:
-                env.parse(template.read())
-
-            # YAML files can also be loaded as Jinja template without errors
-            # try to understand if the file extension is of a YAML file
-            root, ext = os.path.splitext(fileName)
-            if ext.lower() in ['.yaml', '.yml']:
-                textField.setText(errorMsg)
-            else:
-                textField.setText(fileName)
-        except:
-            textField.setText(errorMsg)
+            # Compile the file with the render Environment, the result is kept in the template cache
+            create_environment(Path(fileName).parent).get_template(Path(fileName).name)
+            return True
+        except Exception:
+            return False
+
+    return False
+
 
+###############################
+##    END of Engine code     ##
+###############################
 
-def bind(func, to):  # This is needed to select all text when click on LineEdit
-    'Bind function to instance, unbind if needed'
-    return types.MethodType(func.__func__ if hasattr(func, '__self__') else func, to)
+def cli(argv):  # Command line interface, it never loads PyQt6
+    import argparse
+    parser = argparse.ArgumentParser(prog=Path(__file__).name, description=__appName__, epilog=__usage__,
+                                     fromfile_prefix_chars='@')
+    parser.add_argument('-d', '--database', required=True,
+                        help='Database file in YAML, CSV, JSON or JSON Lines (.jsonl) format, '
+                             'or folder of database files (sharded database)')
+    templates = parser.add_mutually_exclusive_group(required=True)
+    templates.add_argument('-t', '--template', help='Template file in Jinja2 format')
+    templates.add_argument('-j', '--job', metavar='FILE',
+                           help='YAML list of {template, output} to render several templates for each device '
+                                'in one pass, output is an extension or a pattern like docs/{name}.md')
+    parser.add_argument('-p', '--project', default=defFolder, help='Project name (default: current date and time)')
+    parser.add_argument('-e', '--ext', default='.txt',
+                        help="Output file extension or file name pattern like '{name}.cfg' (default: .txt)")
+    parser.add_argument('-o', '--outdir',
+                        help='Folder where the project folder is created (default: NEPyH_Outputs)')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of render processes (threads with --serve), 0 uses all the CPU cores '
+                             '(default: 1, 4 with --serve)')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='Read the database one entry at a time instead of loading it all in memory')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='Keep the project folder and render only the entries changed since the previous build')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='Do not use the on-disk cache of compiled templates and parsed YAML databases')
+    parser.add_argument('-a', '--archive', choices=OutputWriter.archives,
+                        help='Write a single archive instead of a folder of files')
+    parser.add_argument('--defaults', metavar='FILE',
+                        help="YAML file of 'global' and 'groups' defaults merged into the devices (key 'group')")
+    parser.add_argument('--select', nargs='+', metavar='DEVICE',
+                        help="Render only the devices matching these names or glob patterns ('CORE-*'), "
+                             'the other outputs are kept, @FILE reads them from a file one per line')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Store each distinct configuration once (.nepyh_store) and hard link the outputs to it')
+    parser.add_argument('--validate', action='store_true',
+                        help='Check every device against the variables of the template before rendering')
+    parser.add_argument('--diff', nargs='?', const=True, metavar='PROJECT',
+                        help='Report the outputs changed since the previous run of the project, or compared with '
+                             'another project (a name in the output folder, or a path), and save the line diffs '
+                             'in <project>.diff')
+    parser.add_argument('-f', '--force', action='store_true', help='Overwrite the project folder if it already exists')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and update the outputs every time the database or the template change')
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help='Keep running as a local HTTP render service on [HOST:]PORT or on a Unix socket path, '
+                             'GET /render?device=NAME returns one configuration')
+    parser.add_argument('--stats', metavar='FILE',
+                        help='Save stage, device and filter timings of the run in a JSON file')
+    parser.add_argument('--slowest', type=int, default=10, help='Number of slowest devices in the stats (default: 10)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Save a cProfile dump of the run (main process only), read it with pstats')
+    parser.add_argument('--debug', action='store_true', help='Log every configuration created')
+    parser.add_argument('-V', '--version', action='version', version=__version__)
+    args = parser.parse_args(argv)
+    if args.job and (args.watch or args.serve):
+        parser.error('--watch and --serve use a single --template')
+    if isinstance(args.diff, str) and (args.incremental or args.select):
+        parser.error('--diff PROJECT compares every output, it cannot be used with --incremental or --select')
+
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+    outdir = args.outdir or os.path.join(documents_folder(), 'NEPyH_Outputs')
+    out_path = os.path.join(outdir, args.project)
+    if args.workers is None:
+        workers = 4 if args.serve else 1
+    else:
+        workers = args.workers or os.cpu_count()
+    target = f'{out_path}.{args.archive}' if args.archive else out_path
+    if args.watch:
+        try:
+            watch(args.database, args.template, out_path, args.ext, cache=args.cache, defaults=args.defaults)
+        except KeyboardInterrupt:
+            pass
+        except RenderError as exc:
+            logging.error(exc.errorText + exc.errorArgs)
+            return 1
+        return 0
+    if args.serve:
+        try:
+            serve(args.database, args.template, args.serve, args.ext, args.cache, args.defaults, workers)
+        except KeyboardInterrupt:
+            pass
+        except RenderError as exc:
+            logging.error(exc.errorText + exc.errorArgs)
+            return 1
+        except OSError as exc:
+            logging.error(str(exc))
+            return 1
+        return 0
+    if os.path.exists(target) and not (args.force or args.incremental or args.diff is True
+                                       or (args.select and not args.archive)):
+        logging.error(f"Project '{target}' already exists, use --force to overwrite it")
+        return 1
+    if isinstance(args.diff, str):
+        if not os.path.dirname(args.diff):  # A project name, like -p
+            args.diff = os.path.join(outdir, args.diff)
+        if not os.path.isdir(args.diff):
+            logging.error(f"Project '{args.diff}' to compare with not found")
+            return 1
+
+    stats = RenderStats(args.slowest) if (args.stats or args.debug) else None
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        tp_file, fileExt = load_job(args.job, args.cache) if args.job else (args.template, args.ext)
+        config_gen(args.database, tp_file, out_path, fileExt, workers, args.stream, args.incremental,
+                   args.cache, args.archive, args.select, args.defaults, args.dedup, args.validate, args.diff,
+                   stats=stats)
+    except RenderError as exc:
+        logging.error(exc.errorText + exc.errorArgs)
+        return 1
+    except OSError as exc:
+        logging.error(str(exc))
+        return 1
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+    if args.stats:
+        stats.save(args.stats)
+
+    logging.info(f"Project '{args.project}' completed, the files have been generated in: '{target}'")
+    return 0
 
 
 def main():
     logging.basicConfig(
-        level=logging.DEBUG,
+        level=logging.INFO,  # Use --debug from the command line for the details of every device
         format='%(asctime)-15s %(levelname)-8s %(message)s',
         handlers=[
             logging.FileHandler(__logfile__.format(), mode='w'),
             logging.StreamHandler()
         ])
     logging.info('Session Started')
-    app = QtWidgets.QApplication(sys.argv)
-    mainWindow = MainGUI()
-    status = app.exec()
+    if len(sys.argv) > 1:
+        status = cli(sys.argv[1:])
+    else:
+        import nepyh_gui  # PyQt6 is loaded only when the GUI is requested
+        status = nepyh_gui.run()
     logging.info('Session Finished')
     sys.exit(status)
 
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+N.E.Py.H. - Benchmark
+
+Generate synthetic YAML databases of configurable size and measure how fast nepyh renders them
+with the sample templates, stage by stage: YAML load, template compile, render and write.
+Peak memory is reported for each stage with --memory (tracemalloc, slower) and for the whole process.
+With --startup it measures instead the start time of new processes against an import-time budget.
+
+Example:
+    python3 nepyh_bench.py -n 1000 10000 --interfaces 2 8 --json bench.json
+    python3 nepyh_bench.py --startup --budget 150
+
+# Source code info:
+This code follow PEP 8 style guide and it use 4 spaces for indentation.
+"""
+
+from pathlib import Path
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+import nepyh
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+samplesFolder = os.path.join(nepyh.script_path, 'samples')
+defTemplates = ['sample_tp.j2', 'sample_tp_ipaddr.j2']
+stages = ['load', 'compile', 'render', 'write']
+
+
+def generate_database(db_path, devices, interfaces=(2, 8), prefixes=(1, 4), seed=0):  # Write a synthetic YAML database
+    # The entries have the keys used by both sample templates, values are random but reproducible
+    rnd = random.Random(seed)
+    with open(db_path, 'w') as db_file:
+        db_file.write('---\n')
+        for device in range(devices):
+            site, host = divmod(device, 250)
+            db_file.write(f'- hostname: BENCH-{device:06d}\n'
+                          '  mgt:\n'
+                          f'    ip: 10.{site // 256}.{site % 256}.{host + 1}\n'
+                          '    mask: 255.255.255.255\n'
+                          f'  my_ipv4: 172.{16 + site % 16}.{host}.{rnd.randint(1, 254)}/{rnd.randint(16, 30)}\n'
+                          f'  my_ipv6: 2001:db8:{site:x}:{host:x}::{rnd.randint(1, 0xffff):x}/64\n'
+                          '  interfaces:\n')
+            for intf in range(rnd.randint(*interfaces)):
+                db_file.write(f'  - name: GigabitEthernet{intf}/0/0\n'
+                              f'    description: Synthetic interface {intf}\n'
+                              f'    ip: 192.168.{intf}.{host + 1}\n'
+                              '    mask: 255.255.255.0\n')
+            db_file.write('  prefixes:\n')
+            for prefix in range(rnd.randint(*prefixes)):
+                db_file.write(f'  - 10.{prefix}.{site % 256}.0/{rnd.choice((24, 25, 26, 28, 30, 32))}\n')
+
+
+class Stage:  # Context manager measuring the duration and (optionally) the peak memory of a stage
+    def __init__(self, results, name, memory):
+        self.results = results
+        self.name = name
+        self.memory = memory
+
+    def __enter__(self):
+        if self.memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, tracebackobj):
+        self.results[self.name] = {'seconds': time.perf_counter() - self.start}
+        if self.memory:
+            self.results[self.name]['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+def run_benchmark(db_path, tp_file, workdir, fileExt='.txt', memory=False):  # Time each stage of the render pipeline
+    results = {}
+    with Stage(results, 'load', memory):
+        input_db = nepyh.load_database(db_path, cache=False)  # The YAML parser, not the pickle of the parsed database
+
+    with Stage(results, 'compile', memory):
+        # The on-disk template cache is disabled so the real compile time is measured
+        nepyh.create_environment.cache_clear()
+        env = nepyh.create_environment(Path(tp_file).parent, False)
+        input_tp = nepyh.load_template(env, Path(tp_file).name)
+
+    with Stage(results, 'render', memory):
+        rendered = [nepyh.render_entry(input_tp, entry, fileExt) for entry in input_db]
+
+    with Stage(results, 'write', memory):
+        with nepyh.OutputWriter(os.path.join(workdir, 'outputs')) as writer:
+            for out_file_name, result in rendered:
+                writer.write(out_file_name, result)
+
+    results['total'] = {'seconds': sum(results[stage]['seconds'] for stage in stages)}
+    results['devices_per_second'] = len(input_db) / results['total']['seconds']
+    return results
+
+
+def measure_startup(runs=10, top=8):  # Median start time of new processes and the slowest imports of nepyh
+    commands = {'python (baseline)': [sys.executable, '-c', 'pass'],
+                'import nepyh': [sys.executable, '-c', 'import nepyh'],
+                'nepyh.py --version': [sys.executable, os.path.join(nepyh.script_path, 'nepyh.py'), '--version']}
+    results = {}
+    for name, command in commands.items():
+        subprocess.run(command, cwd=nepyh.script_path, capture_output=True, check=True)  # Warm up the .pyc files
+        seconds = []
+        for run in range(runs):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=nepyh.script_path, capture_output=True, check=True)
+            seconds.append(time.perf_counter() - start)
+        results[name] = statistics.median(seconds)
+
+    # Lines of -X importtime: 'import time: self [us] | cumulative | imported package', nested imports are indented
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import nepyh'], cwd=nepyh.script_path,
+                            capture_output=True, text=True, check=True).stderr
+    imports = []
+    for line in output.splitlines()[1:]:
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].startswith('   ') and not fields[2].startswith('    '):  # Imported by nepyh
+            imports.append((int(fields[1]) / 1e6, fields[2].strip()))
+    results['slowest_imports'] = sorted(imports, reverse=True)[:top]
+    return results
+
+
+def print_startup(results, budget):
+    for name, seconds in results.items():
+        if name != 'slowest_imports':
+            print(f'{name:<22}{seconds * 1000:>8.1f} ms')
+    print(f'Budget of nepyh.py --version: {budget:.0f} ms')
+    print('Slowest imports of nepyh:')
+    for seconds, module in results['slowest_imports']:
+        print(f'  {module:<20}{seconds * 1000:>8.1f} ms')
+
+
+def print_table(rows, memory):
+    header = f"{'devices':>8} {'template':<22}" + ''.join(f'{stage + " s":>10}' for stage in stages + ['total'])
+    header += f"{'dev/s':>10}"
+    if memory:
+        header += ''.join(f'{stage + " MB":>11}' for stage in stages)
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        res = row['results']
+        line = f"{row['devices']:>8} {row['template']:<22}"
+        line += ''.join(f"{res[stage]['seconds']:>10.3f}" for stage in stages + ['total'])
+        line += f"{res['devices_per_second']:>10.0f}"
+        if memory:
+            line += ''.join(f"{res[stage]['peak_bytes'] / 2 ** 20:>11.1f}" for stage in stages)
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=f'{nepyh.__appName__} - Benchmark')
+    parser.add_argument('-n', '--devices', type=int, nargs='+', default=[1000, 10000],
+                        help='Number of devices of the synthetic databases (default: 1000 10000)')
+    parser.add_argument('-t', '--templates', nargs='+', default=defTemplates,
+                        help='Templates to render, file names are looked up in samples/ (default: both samples)')
+    parser.add_argument('--interfaces', type=int, nargs=2, default=[2, 8], metavar=('MIN', 'MAX'),
+                        help='Interfaces per device (default: 2 8)')
+    parser.add_argument('--prefixes', type=int, nargs=2, default=[1, 4], metavar=('MIN', 'MAX'),
+                        help='Prefixes per device (default: 1 4)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random values (default: 0)')
+    parser.add_argument('-m', '--memory', action='store_true', help='Measure the peak memory of each stage (slower)')
+    parser.add_argument('--json', help='Save the results in a JSON file')
+    parser.add_argument('--startup', action='store_true',
+                        help='Measure the start time of new processes instead of the render stages')
+    parser.add_argument('--budget', type=float, default=150,
+                        help='Import-time budget of nepyh.py --version in ms, exceeded returns 1 (default: 150)')
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = measure_startup()
+        print_startup(results, args.budget)
+        if args.json:
+            with open(args.json, 'w') as json_file:
+                json.dump({'version': nepyh.__version__, 'python': sys.version.split()[0], 'startup': results},
+                          json_file, indent=2)
+        return 1 if results['nepyh.py --version'] * 1000 > args.budget else 0
+
+    for module in (nepyh.yaml, nepyh.jinja2, nepyh.netaddr):  # Imported on first use, not inside the timed stages
+        module.__name__
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='nepyh_bench_') as workdir:
+        for devices in args.devices:
+            db_path = os.path.join(workdir, f'bench_{devices}.yml')
+            generate_database(db_path, devices, args.interfaces, args.prefixes, args.seed)
+            for template in args.templates:
+                tp_file = template if os.path.exists(template) else os.path.join(samplesFolder, template)
+                results = run_benchmark(db_path, tp_file, workdir, memory=args.memory)
+                rows.append({'devices': devices, 'template': Path(template).name, 'results': results})
+            os.remove(db_path)
+
+    print_table(rows, args.memory)
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        maxrss = maxrss / 2 ** 20 if sys.platform == 'darwin' else maxrss / 2 ** 10  # bytes on macOS, KB on Linux
+        print(f'Process peak memory: {maxrss:.1f} MB')
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'version': nepyh.__version__, 'python': sys.version.split()[0], 'rows': rows},
+                      json_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
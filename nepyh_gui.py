@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+N.E.Py.H. - Graphical User Interface
+
+PyQt6 front-end of NEPyH, loaded by nepyh.py only when the program is started without command line arguments.
+The render pipeline itself lives in nepyh.py and is shared with the command line interface.
+
+# Source code info:
+This code follow PEP 8 style guide and it use 4 spaces for indentation.
+"""
+
+from PyQt6 import QtCore, QtWidgets, QtGui  # import PyQt6 for GUI
+from pathlib import Path
+import os  # import OS module to create directory
+import sys
+import time
+import types
+import io
+import traceback
+import logging
+import subprocess
+import platform
+import threading
+
+import nepyh
+from nepyh import (__appName__, __author__, __version__, __license__, __homepage__, __email__, __issues__,
+                   __logfile__, __YAMLlint__, __icon__, defFolder, myDocuments)
+
+
+###############################
+##     START of GUI code     ##
+###############################
+
+# Drag and Drop filename to QLineEdit
+class DragDropQLineEdit(QtWidgets.QLineEdit):
+    def __init__(self, title, parent, fileType):
+        super().__init__(title, parent)
+        self.fileType = fileType
+        self.setAcceptDrops(True)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.accept()
+        else:
+            event.ignore()
+
+    def dropEvent(self, event):
+        files = []
+        for url in event.mimeData().urls():
+            files.append(url.toLocalFile())
+        setValidFile(self.fileType, files[0], self)
+
+# Run the render engine outside the Qt main thread
+class RenderThread(QtCore.QThread):
+    progress = QtCore.pyqtSignal(int, object, float)  # done, total (None if unknown), seconds since start
+    completed = QtCore.pyqtSignal(str)  # report
+    failed = QtCore.pyqtSignal(object)  # exception
+
+    def __init__(self, parent, *args, **kwargs):
+        super().__init__(parent)
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel = threading.Event()
+        self.lastUpdate = 0
+
+    def _progress(self, done, total):
+        elapsed = time.monotonic() - self.start_time
+        if elapsed - self.lastUpdate >= 0.1 or done == total:  # Limit the GUI updates to 10 per second
+            self.lastUpdate = elapsed
+            self.progress.emit(done, total, elapsed)
+
+    def run(self):
+        self.start_time = time.monotonic()
+        try:
+            report = nepyh.config_gen(*self.args, progress=self._progress, cancel=self.cancel, **self.kwargs)
+        except Exception as exc:  # Errors are shown by the main thread
+            self.failed.emit(exc)
+        else:
+            self.completed.emit(report)
+
+# Main GUI
+
+
+class MainGUI(QtWidgets.QMainWindow):
+
+    def __init__(self):
+        super(MainGUI, self).__init__()
+
+        # Create empty text box
+        # textEdit = QtWidgets.QTextEdit()
+        # self.setCentralWidget(textEdit)
+
+        # Menubar Quit action:
+        quitAction = QtGui.QAction('&Quit', self)
+        quitAction.setShortcut('Ctrl+Q')
+        quitAction.setStatusTip('Exit application')
+        quitAction.triggered.connect(QtWidgets.QApplication.quit)
+
+        # Menubar Documentation action:
+        documentationAction = QtGui.QAction('&Documentation', self)
+        documentationAction.setShortcut('F1')
+        documentationAction.setStatusTip('Help and guidelines on NEPyH')
+        documentationAction.triggered.connect(lambda: QtGui.QDesktopServices.openUrl(QtCore.QUrl(__homepage__)))
+
+        # Menubar YAML lint action:
+        yamllintAction = QtGui.QAction('&YAML lint', self)
+        yamllintAction.setStatusTip('Online YAML validation tool')
+        yamllintAction.triggered.connect(lambda: QtGui.QDesktopServices.openUrl(QtCore.QUrl(__YAMLlint__)))
+
+        # Menubar Issues action:
+        issuesAction = QtGui.QAction('&Issues', self)
+        issuesAction.setStatusTip('Report bugs and issues')
+        issuesAction.triggered.connect(lambda: QtGui.QDesktopServices.openUrl(QtCore.QUrl(__issues__)))
+
+        # Menubar SW Upgrade action:
+        swupgradeAction = QtGui.QAction('&SW Upgrade', self)
+        swupgradeAction.setStatusTip('Check for new software versions')
+
+        # Menubar About action:
+        aboutAction = QtGui.QAction('&About', self)
+        aboutAction.setStatusTip('Information about NEPyH')
+        aboutAction.triggered.connect(lambda: self.about())
+
+        # Create a status bar
+        self.statusBar()
+
+        # Create a menu bar
+        menubar = self.menuBar()
+
+        # Menubar File
+        fileMenu = menubar.addMenu('&File')
+        fileMenu.addAction(quitAction)
+
+        # Menubar Help
+        helpMenu = menubar.addMenu('&Help')
+        helpMenu.addAction(documentationAction)
+        helpMenu.addAction(yamllintAction)
+        helpMenu.addAction(issuesAction)
+        helpMenu.addAction(swupgradeAction)
+        helpMenu.addAction(aboutAction)
+
+        # Create a toolbar
+        # toolbar = self.addToolBar('CFG Gen')
+        # toolbar.addAction(changeLayoutCFG)
+        # toolbar = self.addToolBar('Shut / No Shut')
+
+        # Create a central Widgets
+        centralWidget = QtWidgets.QWidget()
+
+        # Create a Layout for the central Widget
+        centralLayout = QtWidgets.QGridLayout()
+
+        # Config generator Layout elements
+        # Labels
+        self.databaseLb = QtWidgets.QLabel('Database: (YAML, CSV, JSON)')
+        self.templateLb = QtWidgets.QLabel('Template: (Jinja2)')
+        self.projectLb = QtWidgets.QLabel('Project name:')
+        self.fileExtLb = QtWidgets.QLabel('Output file extension:')
+        self.workersLb = QtWidgets.QLabel('Render processes:')
+        # Text lines
+        self.databaseEdit = DragDropQLineEdit('< Drag & Drop a YAML file or Browse >', self, 'YAML')
+        self.databaseEdit.focusInEvent = bind(
+            lambda w, e: QtCore.QTimer.singleShot(0, w.selectAll),
+            self.databaseEdit)  # This is needed to select all text when click on LineEdit
+        self.templateEdit = DragDropQLineEdit('< Drag & Drop a Jinja2 file or Browse >', self, 'JINJA')
+        self.templateEdit.focusInEvent = bind(
+            lambda w, e: QtCore.QTimer.singleShot(0, w.selectAll),
+            self.templateEdit)  # This is needed to select all text when click on LineEdit
+        self.projectEdit = QtWidgets.QLineEdit(defFolder)
+        self.projectEdit.focusInEvent = bind(
+            lambda w, e: QtCore.QTimer.singleShot(0, w.selectAll),
+            self.projectEdit)  # This is needed to select all text when click on LineEdit
+        self.fileExtEdit = QtWidgets.QLineEdit('.txt')
+        self.fileExtEdit.focusInEvent = bind(
+            lambda w, e: QtCore.QTimer.singleShot(0, w.selectAll),
+            self.fileExtEdit)  # This is needed to select all text when click on LineEdit
+        self.workersEdit = QtWidgets.QSpinBox()
+        self.workersEdit.setRange(1, os.cpu_count() or 1)
+        self.workersEdit.setValue(1)
+        self.incrementalCb = QtWidgets.QCheckBox('Incremental build')
+        self.incrementalCb.setStatusTip('Keep the project folder and render only the entries changed since the previous build')
+        self.validateCb = QtWidgets.QCheckBox('Validate first')
+        self.validateCb.setChecked(False)
+        self.validateCb.setStatusTip('Check every device against the variables of the template before rendering')
+        self.diffCb = QtWidgets.QCheckBox('Report changes')
+        self.diffCb.setChecked(True)
+        self.diffCb.setStatusTip('Compare with the previous outputs of the project and save the differences in <project>.diff')
+        # Buttons
+        self.databaseBtn = QtWidgets.QPushButton('Browse')
+        self.databaseBtn.clicked.connect(lambda: self._getFilePath(self.databaseEdit))
+        self.templateBtn = QtWidgets.QPushButton('Browse')
+        self.templateBtn.clicked.connect(lambda: self._getFilePath(self.templateEdit))
+        self.projectBtn = QtWidgets.QPushButton('Update')
+        self.projectBtn.clicked.connect(self._updateDefFolder)
+        self.cfgenBtn = QtWidgets.QPushButton('Run')
+        self.cfgenBtn.clicked.connect(self.config_gen)
+        self.cancelBtn = QtWidgets.QPushButton('Cancel')
+        self.cancelBtn.setEnabled(False)
+        self.cancelBtn.clicked.connect(self._cancel)
+        # Progress of the running task
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setTextVisible(True)
+        self.progressBar.setFormat('')
+        self.renderThread = None
+
+        # Config generator Layout - make a grid and stitch all together
+        cfgenLayout = QtWidgets.QGridLayout()
+        cfgenLayout.setSpacing(10)
+        cfgenLayout.addWidget(self.databaseLb, 1, 0)
+        cfgenLayout.addWidget(self.databaseEdit, 1, 1)
+        cfgenLayout.addWidget(self.databaseBtn, 1, 2)
+
+        cfgenLayout.addWidget(self.templateLb, 2, 0)
+        cfgenLayout.addWidget(self.templateEdit, 2, 1)
+        cfgenLayout.addWidget(self.templateBtn, 2, 2)
+
+        cfgenLayout.addWidget(self.projectLb, 3, 0)
+        cfgenLayout.addWidget(self.projectEdit, 3, 1)
+        cfgenLayout.addWidget(self.projectBtn, 3, 2)
+
+        cfgenLayout.addWidget(self.fileExtLb, 4, 0)
+        cfgenLayout.addWidget(self.fileExtEdit, 4, 1)
+
+        cfgenLayout.addWidget(self.cfgenBtn, 4, 2)
+
+        cfgenLayout.addWidget(self.workersLb, 5, 0)
+        cfgenLayout.addWidget(self.workersEdit, 5, 1)
+        cfgenLayout.addWidget(self.incrementalCb, 5, 2)
+
+        cfgenLayout.addWidget(self.diffCb, 6, 1)
+        cfgenLayout.addWidget(self.validateCb, 6, 2)
+
+        cfgenLayout.addWidget(self.progressBar, 7, 0, 1, 2)
+        cfgenLayout.addWidget(self.cancelBtn, 7, 2)
+
+        # Set the default Layout
+        # centralWidget.setLayout(centralLayout)
+        centralWidget.setLayout(cfgenLayout)
+
+        # Set the Widget
+        self.setCentralWidget(centralWidget)
+
+        # Set main windows size, position, title and icons
+        self.resize(600, 10)
+        self.center()
+        self.setWindowTitle(__appName__)
+        self.setWindowIcon(QtGui.QIcon(__icon__))
+        self.show()
+
+        # Override system excepthook to show error within the GUI
+        sys.excepthook = self._excepthook
+
+    def center(self):  # [GUI] Move the main window to the center of the screen
+        qr = self.frameGeometry()
+        cp = QtGui.QGuiApplication.primaryScreen().availableGeometry().center()
+        qr.moveCenter(cp)
+        self.move(qr.topLeft())
+
+    def about(self):  # [GUI] Ab out window
+        aboutMsg = QtWidgets.QMessageBox()
+        aboutMsg.setContentsMargins(10, 0, 40, 0)
+        aboutMsg.setWindowTitle('About')
+        aboutMsg.setText(f'\n   {__appName__}\n\n'
+                         f'        Author: {__author__}\n'
+                         f'        Version: {__version__}\n'
+                         f'        License:  {__license__}\n\n'
+                         f'        {__homepage__}'
+                         )
+        aboutMsg.setStandardButtons(QtWidgets.QMessageBox.StandardButton.Ok)
+        aboutMsg.exec()
+
+    ###############################
+    ##      END of GUI code      ##
+    ###############################
+
+    def _updateDefFolder(self):
+        defFolder = time.strftime('%Y%m%d-%H%M%S')
+        self.projectEdit.setText(defFolder)
+
+    def _getFilePath(self, textField):
+        fileName = ''
+        if textField.fileType == 'YAML':
+            fileName = QtWidgets.QFileDialog.getOpenFileName(self, 'Select file', '.', '*.yml *.yaml *.csv *.json *.jsonl')[0]
+
+        if textField.fileType == 'JINJA':
+            fileName = QtWidgets.QFileDialog.getOpenFileName(self, 'Select file', '.', '*.j2 *.jinja')[0]
+
+        setValidFile(textField.fileType, fileName, textField)
+
+    def _excepthook(self, excType, excValue, tracebackobj):
+        """
+        Global function to catch unhandled exceptions.
+
+        @param excType exception type
+        @param excValue exception value
+        @param tracebackobj traceback object
+        """
+        infoVersion = f'Version: {__version__} \n'
+        separator = '-' * 80
+        notice = ('An unhandled exception occurred.\n'
+                  f'Please report the problem via email to <{__email__}>\n'
+                  f'A log has been written to {__logfile__}\n\n'
+                  'Expand for more details:')
+        timeString = time.strftime("%Y-%m-%d, %H:%M:%S")
+
+        tbinfofile = io.StringIO()
+        traceback.print_tb(tracebackobj, None, tbinfofile)
+        tbinfofile.seek(0)
+        tbinfo = tbinfofile.read()
+        errmsg = f'{str(excType)}: \n{str(excValue)}'
+        sections = [separator, timeString, separator, errmsg, separator, tbinfo]
+        msg = '\n'.join(sections)
+        logging.error(infoVersion + msg)
+        errorbox = QtWidgets.QMessageBox()
+        errorbox.setContentsMargins(10, 0, 40, 0)
+        errorbox.setIcon(QtWidgets.QMessageBox.Icon.Critical)
+        errorbox.setWindowTitle('Unhandled Error')
+        errorbox.setText(notice)
+        errorbox.setDetailedText(str(infoVersion) + str(msg))
+        errorbox.exec()
+
+    def handleErrors(self, errorText, errorArgs):
+        logging.error(errorText + errorArgs)
+        err_msg = QtWidgets.QMessageBox()
+        err_msg.setContentsMargins(10, 0, 40, 0)
+        err_msg.setIcon(QtWidgets.QMessageBox.Icon.Critical)
+        err_msg.setWindowTitle('Error')
+        err_msg.setText(errorText)
+        err_msg.setDetailedText(errorArgs)
+        err_msg.setStandardButtons(QtWidgets.QMessageBox.StandardButton.Ok)
+        err_msg.exec()
+
+    def openFile(self, filepath):
+        if platform.system() == 'Darwin':       # macOS
+            subprocess.call(('open', filepath))
+        elif platform.system() == 'Windows':    # Windows
+            os.startfile(filepath)
+        else:                                   # linux variants
+            subprocess.call(('xdg-open', filepath))
+
+    def checkdir(self, out_path):  # This function will ask before overwriting an existing project folder
+        # The folder is replaced only when the new outputs are complete, see nepyh.OutputWriter
+        if not os.path.exists(out_path):
+            return True
+        reply = QtWidgets.QMessageBox.question(
+            self, 'Warning', 'Project folder already exists and will be overwritten, continue?', QtWidgets.QMessageBox.StandardButton.Yes
+            | QtWidgets.QMessageBox.StandardButton.No, QtWidgets.QMessageBox.StandardButton.No)
+        return reply == QtWidgets.QMessageBox.StandardButton.Yes
+
+    def config_gen(self):  # This function cover the config generator
+        out_path = os.path.join(myDocuments, 'NEPyH_Outputs', Path(self.projectEdit.text()))
+        db_path = self.databaseEdit.text()
+        tp_file = self.templateEdit.text()
+        fileExt = self.fileExtEdit.text()
+        workers = self.workersEdit.value()
+        incremental = self.incrementalCb.isChecked()
+        validate = self.validateCb.isChecked()
+        diff = self.diffCb.isChecked()
+
+        if not incremental and self.checkdir(out_path) == False:  # Incremental builds update the previous outputs
+            return
+
+        # The render pipeline is shared with the command line interface and runs on a worker thread
+        self.renderThread = RenderThread(self, db_path, tp_file, out_path, fileExt, workers, incremental=incremental,
+                                         validate=validate, diff=diff)
+        self.renderThread.progress.connect(self._updateProgress)
+        self.renderThread.completed.connect(lambda report: self._renderCompleted(out_path, report))
+        self.renderThread.failed.connect(self._renderFailed)
+        self.renderThread.finished.connect(self._renderFinished)
+        self.cfgenBtn.setEnabled(False)
+        self.cancelBtn.setEnabled(True)
+        self.progressBar.setRange(0, 0)  # Busy until the first update
+        self.progressBar.setFormat('Loading...')
+        self.renderThread.start()
+
+    def _cancel(self):
+        if self.renderThread is not None:
+            self.renderThread.cancel.set()
+            self.cancelBtn.setEnabled(False)
+            self.progressBar.setFormat('Cancelling...')
+
+    def _updateProgress(self, done, total, elapsed):
+        rate = done / elapsed if elapsed else 0
+        if total:
+            eta = (total - done) / rate if rate else 0
+            self.progressBar.setRange(0, total)
+            self.progressBar.setValue(done)
+            self.progressBar.setFormat(f'{done} / {total} devices - {rate:.0f} devices/s - ETA {eta:.0f}s')
+        else:  # Streamed database, the number of devices is not known
+            self.progressBar.setFormat(f'{done} devices - {rate:.0f} devices/s')
+
+    def _renderFinished(self):
+        self.renderThread = None
+        self.cfgenBtn.setEnabled(True)
+        self.cancelBtn.setEnabled(False)
+        self.progressBar.setRange(0, 1)
+        self.progressBar.setValue(0)
+        self.progressBar.setFormat('')
+
+    def _renderFailed(self, exc):
+        if isinstance(exc, nepyh.RenderCancelled):
+            logging.info(exc.errorText)
+            self.statusBar().showMessage('Task cancelled, previous outputs have been kept', 5000)
+        elif isinstance(exc, nepyh.RenderError):
+            self.handleErrors(exc.errorText, exc.errorArgs)
+        else:
+            self._excepthook(type(exc), exc, exc.__traceback__)
+
+    def _renderCompleted(self, out_path, report):
+        # Final messagebox when configuration is correctly generated
+        end_msg = QtWidgets.QMessageBox()
+        end_msg.setIcon(QtWidgets.QMessageBox.Icon.Information)
+        end_msg.setWindowTitle('Task Finished')
+        end_msg.setText(f"\nProject '{Path(out_path).name}' completed!\n\n"
+                        'The files have been generated in the folder: \n'
+                        f"  '{str(out_path)}'\n")
+        end_msg.setDetailedText(report)
+        end_msg.setStandardButtons(QtWidgets.QMessageBox.StandardButton.Ok | QtWidgets.QMessageBox.StandardButton.Open)
+        result = end_msg.exec()
+        if result == QtWidgets.QMessageBox.StandardButton.Open:
+            self.openFile(str(out_path))
+
+    def closeEvent(self, event):  # [GUI] The main window is closed, stop the running task first
+        if self.renderThread is not None:
+            self.renderThread.cancel.set()
+            self.renderThread.wait()
+        event.accept()
+
+
+def setValidFile(fileType, fileName, textField):
+    # Set error message for invalid file
+    errorMsg = f'< Not a valid {fileType} file >'
+
+    if nepyh.validate_file(fileType, fileName):
+        textField.setText(fileName)
+    else:
+        textField.setText(errorMsg)
+
+
+def bind(func, to):  # This is needed to select all text when click on LineEdit
+    'Bind function to instance, unbind if needed'
+    return types.MethodType(func.__func__ if hasattr(func, '__self__') else func, to)
+
+
+def run():  # Start the Qt application and return its exit status
+    app = QtWidgets.QApplication(sys.argv)
+    mainWindow = MainGUI()
+    return app.exec()